@@ -12,7 +12,57 @@ class PluginConfig:
             "model_name": "gpt-4o",
             "stt_api_key": "",
             "stt_base_url": "",
-            "stt_model": ""
+            "stt_model": "",
+            # legacy: 原模板 + message_str/消息链双重注入
+            # prefix_stable: 静态人设在前、动态内容在后，只注入一次
+            "injection_mode": "legacy",
+            # 同一会话内只注入新增/变化的内容，满 N 轮或空闲超时后全量刷新
+            "delta_injection": False,
+            "delta_refresh_turns": 20,
+            "delta_idle_seconds": 1800,
+            # 共享记忆服务地址，如 unix:///AstrBot/data/soulmate_data/memory.sock；留空则进程内加载
+            "memory_service_address": "",
+            "memory_service_pool_size": 4,
+            # 并发检索微批：单批上限 / 最长等待（毫秒），上限 <= 1 时关闭
+            "retrieval_batch_max_size": 16,
+            "retrieval_batch_max_wait_ms": 0,
+            # 插件专用线程池：IO（Chroma/MCP）与 CPU（格式化/哈希），排队满时不注入直接放行
+            "io_workers": 8,
+            "io_queue_size": 32,
+            "cpu_workers": 2,
+            "cpu_queue_size": 32,
+            # 图片预处理：最长边上限、重编码格式 (JPEG / WEBP) 与质量
+            "image_max_side": 1280,
+            "image_format": "JPEG",
+            "image_quality": 80,
+            # MCP 临时图片目录：总配额、过期时间，以及留在内存中不落盘的大小上限
+            "temp_media_dir": "/AstrBot/data/mcp_temp",
+            "temp_media_quota_mb": 256,
+            "temp_media_ttl_seconds": 3600,
+            "temp_media_memory_kb": 512,
+            # 向量存储后端：chroma / numpy（numpy 后端向量量化方式 float16 / int8）
+            "memory_backend": "chroma",
+            "memory_quantization": "float16",
+            # 冷热分层：闲置超过 N 天的用户归档（0 关闭），每隔 N 小时检查一次
+            "tiering_idle_days": 0,
+            "tiering_interval_hours": 6,
+            # profile 列表字段（性格、话题、交互模式）各自保留的最近条目数
+            "profile_list_cap": 20,
+            # 管理员 /perf profile <秒> 采样分析，默认关闭
+            "enable_profiler": False,
+            # 记忆统计对账间隔（小时）
+            "stats_reconcile_hours": 6,
+            # 预热：启动时预取最活跃的 N 个用户（0 关闭），预取缓存的用户数上限与有效期
+            "warmup_top_users": 50,
+            "warmup_cache_users": 256,
+            "warmup_ttl_seconds": 300,
+            # 群组记忆：群事实 / 话题 / 近期群聊，群内成员共用一份群摘要。
+            # 开启后会把所有群消息（包括不是发给 bot 的）写入 group_memory.json，默认关闭
+            "group_memory": False,
+            "group_recent_turns": 8,
+            # 向量模型（sentence-transformers 名称），留空使用 Chroma 默认模型；
+            # 修改后需先停止 bot，再执行 maintenance compact --reembed
+            "embedding_model": ""
         }
         self.data = self._load()
 
@@ -59,4 +109,138 @@ class PluginConfig:
 
     @property
     def stt_model(self): 
-        return os.getenv("SAKIKO_STT_MODEL") or self.data.get("stt_model", "")
\ No newline at end of file
+        return os.getenv("SAKIKO_STT_MODEL") or self.data.get("stt_model", "")
+
+    @property
+    def injection_mode(self):
+        return os.getenv("SAKIKO_INJECTION_MODE") or self.data.get("injection_mode", "legacy")
+
+    @property
+    def delta_injection(self):
+        env = os.getenv("SAKIKO_DELTA_INJECTION")
+        if env is not None:
+            return env.lower() in ("1", "true", "yes", "on")
+        return bool(self.data.get("delta_injection", False))
+
+    @property
+    def delta_refresh_turns(self):
+        return int(self.data.get("delta_refresh_turns", 20))
+
+    @property
+    def delta_idle_seconds(self):
+        return float(self.data.get("delta_idle_seconds", 1800))
+
+    @property
+    def memory_service_address(self):
+        return os.getenv("SAKIKO_MEMORY_SERVICE") or self.data.get("memory_service_address", "")
+
+    @property
+    def memory_service_pool_size(self):
+        return int(self.data.get("memory_service_pool_size", 4))
+
+    @property
+    def retrieval_batch_max_size(self):
+        return int(self.data.get("retrieval_batch_max_size", 16))
+
+    @property
+    def retrieval_batch_max_wait_ms(self):
+        return float(self.data.get("retrieval_batch_max_wait_ms", 0))
+
+    @property
+    def io_workers(self):
+        return int(self.data.get("io_workers", 8))
+
+    @property
+    def io_queue_size(self):
+        return int(self.data.get("io_queue_size", 32))
+
+    @property
+    def cpu_workers(self):
+        return int(self.data.get("cpu_workers", 2))
+
+    @property
+    def cpu_queue_size(self):
+        return int(self.data.get("cpu_queue_size", 32))
+
+    @property
+    def image_max_side(self):
+        return int(self.data.get("image_max_side", 1280))
+
+    @property
+    def image_format(self):
+        return self.data.get("image_format", "JPEG")
+
+    @property
+    def image_quality(self):
+        return int(self.data.get("image_quality", 80))
+
+    @property
+    def temp_media_dir(self):
+        return self.data.get("temp_media_dir", "/AstrBot/data/mcp_temp")
+
+    @property
+    def temp_media_quota_mb(self):
+        return int(self.data.get("temp_media_quota_mb", 256))
+
+    @property
+    def temp_media_ttl_seconds(self):
+        return int(self.data.get("temp_media_ttl_seconds", 3600))
+
+    @property
+    def temp_media_memory_kb(self):
+        return int(self.data.get("temp_media_memory_kb", 512))
+
+    @property
+    def memory_backend(self):
+        return os.getenv("SAKIKO_MEMORY_BACKEND") or self.data.get("memory_backend", "chroma")
+
+    @property
+    def memory_quantization(self):
+        return self.data.get("memory_quantization", "float16")
+
+    @property
+    def tiering_idle_days(self):
+        return float(self.data.get("tiering_idle_days", 0))
+
+    @property
+    def tiering_interval_hours(self):
+        return float(self.data.get("tiering_interval_hours", 6))
+
+    @property
+    def profile_list_cap(self):
+        return int(self.data.get("profile_list_cap", 20))
+
+    @property
+    def enable_profiler(self):
+        env = os.getenv("SAKIKO_ENABLE_PROFILER")
+        if env is not None:
+            return env.lower() in ("1", "true", "yes", "on")
+        return bool(self.data.get("enable_profiler", False))
+
+    @property
+    def stats_reconcile_hours(self):
+        return float(self.data.get("stats_reconcile_hours", 6))
+
+    @property
+    def warmup_top_users(self):
+        return int(self.data.get("warmup_top_users", 50))
+
+    @property
+    def warmup_cache_users(self):
+        return int(self.data.get("warmup_cache_users", 256))
+
+    @property
+    def warmup_ttl_seconds(self):
+        return float(self.data.get("warmup_ttl_seconds", 300))
+
+    @property
+    def group_memory(self):
+        return bool(self.data.get("group_memory", False))
+
+    @property
+    def group_recent_turns(self):
+        return int(self.data.get("group_recent_turns", 8))
+
+    @property
+    def embedding_model(self):
+        return os.getenv("SAKIKO_EMBEDDING_MODEL") or self.data.get("embedding_model", "")
@@ -12,7 +12,9 @@ import os
 import json
 import datetime
 import asyncio
-from astrbot.api import logger
+import threading
+from collections import OrderedDict
+from .log import logger
 
 # MCP Client
 from mcp import ClientSession, StdioServerParameters
@@ -20,9 +22,26 @@ from mcp.client.stdio import stdio_client
 
 # Internal Modules
 from .memory import MemoryManager
+from .memory_service import MemoryClient
+from .metrics import metrics
+from .session import InjectionTracker, fingerprint, MAX_TRACKED_SESSIONS
+from .image_prep import ImagePreprocessor
+from .temp_media import TempMediaManager, TempMediaQuotaExceeded
 from .prompts import (
     INJECTION_TEMPLATE,
-    USER_CONTEXT_TEMPLATE
+    USER_CONTEXT_TEMPLATE,
+    PERSONA_BLOCK,
+    USER_BLOCK_TEMPLATE,
+    TURN_BLOCK_TEMPLATE,
+    OBSERVATION_BLOCK_TEMPLATE,
+    RESPONSE_CUE,
+    DELTA_HEADER,
+    DELTA_PROFILE_TEMPLATE,
+    DELTA_MEMORIES_TEMPLATE,
+    DELTA_HISTORY_TEMPLATE,
+    GROUP_BLOCK_TEMPLATE,
+    GROUP_TURNS_TEMPLATE,
+    DELTA_GROUP_TEMPLATE
 )
 
 # Topic end keywords
@@ -32,8 +51,32 @@ TOPIC_END_KEYWORDS = [
 ]
 
 
+INJECTION_MODE_LEGACY = "legacy"
+INJECTION_MODE_PREFIX_STABLE = "prefix_stable"
+
+# AstrBot 中会新建 / 切换 / 清空对话的指令，原生 agent 的历史随之丢失
+CONVERSATION_RESET_COMMANDS = {"new", "reset", "switch", "del"}
+
+
+def _format_group_turns(entries):
+    """群聊发言按时间正序排列，带发言人"""
+    return "\n".join(
+        f"{item['speaker']}: {item['content']}" if item.get("speaker") else item["content"]
+        for item in reversed(entries)
+    )
+
+
+def _drop_summary_facts(memories):
+    """群摘要里已经列出的群事实不再作为检索到的记忆重复注入"""
+    facts = set((memories.get("group") or {}).get("facts") or ())
+    if facts and memories.get("insights"):
+        memories["insights"] = [item for item in memories["insights"] if item not in facts]
+
+
 class SakikoAgent:
     def __init__(self, config):
+        self.cfg = config
+        self.injection_mode = getattr(config, "injection_mode", INJECTION_MODE_LEGACY)
         plugin_dir = getattr(config, "BASE_DIR", None) or os.getenv("PLUGIN_DIR", "/AstrBot/data")
         self.api_key = os.getenv("MINIMAX_API_KEY") or "sk-cp-你的key"
         self.host = os.getenv("MINIMAX_API_HOST", "https://api.minimaxi.com")
@@ -50,7 +93,51 @@ class SakikoAgent:
             }
         )
 
-        self.memory = MemoryManager(plugin_dir)
+        service_address = getattr(config, "memory_service_address", "")
+        # 使用共享记忆服务时，冷热分层、对账、预热由服务进程负责
+        self.remote_memory = bool(service_address)
+        if service_address:
+            logger.info(f"[Sakiko] Using shared memory service: {service_address}")
+            self.memory = MemoryClient(service_address, pool_size=getattr(config, "memory_service_pool_size", 4))
+        else:
+            self.memory = MemoryManager(
+                plugin_dir,
+                batch_max_size=getattr(config, "retrieval_batch_max_size", 16),
+                batch_max_wait_ms=getattr(config, "retrieval_batch_max_wait_ms", 0),
+                backend=getattr(config, "memory_backend", "chroma"),
+                quantization=getattr(config, "memory_quantization", "float16"),
+                tiering_idle_days=getattr(config, "tiering_idle_days", 0),
+                profile_list_cap=getattr(config, "profile_list_cap", 20),
+                warmup_cache_users=getattr(config, "warmup_cache_users", 256),
+                warmup_ttl_seconds=getattr(config, "warmup_ttl_seconds", 300),
+                group_recent_turns=getattr(config, "group_recent_turns", 8),
+                embedding_model=getattr(config, "embedding_model", "")
+            )
+
+        self.image_prep = ImagePreprocessor(
+            max_side=getattr(config, "image_max_side", 1280),
+            fmt=getattr(config, "image_format", "JPEG"),
+            quality=getattr(config, "image_quality", 80)
+        )
+
+        self.temp_media = TempMediaManager(
+            directory=getattr(config, "temp_media_dir", "/AstrBot/data/mcp_temp"),
+            quota_bytes=getattr(config, "temp_media_quota_mb", 256) * 1024 * 1024,
+            ttl_seconds=getattr(config, "temp_media_ttl_seconds", 3600),
+            memory_bytes=getattr(config, "temp_media_memory_kb", 512) * 1024
+        )
+
+        # 每个用户上一轮的注入文本，用于计算前缀稳定度（LRU，最多 MAX_TRACKED_SESSIONS 个用户）
+        self._last_injection = OrderedDict()
+        self._injection_lock = threading.Lock()
+
+        # 会话级增量注入
+        self.tracker = None
+        if getattr(config, "delta_injection", False):
+            self.tracker = InjectionTracker(
+                refresh_turns=getattr(config, "delta_refresh_turns", 20),
+                idle_seconds=getattr(config, "delta_idle_seconds", 1800)
+            )
 
     # ============================================================
     # MCP Tool Calls
@@ -82,11 +169,41 @@ class SakikoAgent:
             logger.error(f"[Sakiko] Image understanding failed: {e}")
             return ""
 
+    def _describe_image(self, image, user_id) -> str:
+        """
+        预处理（压缩 + 内容指纹）后再调用图像理解，同一用户重复发送的同一张图复用已有描述
+
+        image 可以是本地路径或二进制文件对象；只有需要调用 MCP 时才落盘，调用结束即删除
+        """
+        prepared = self.image_prep.prepare(image)
+        if prepared.prepared_bytes < prepared.original_bytes:
+            logger.info(f"[Sakiko] Image preprocessed: {prepared.original_bytes} -> {prepared.prepared_bytes} bytes "
+                        f"in {prepared.elapsed_ms:.1f}ms")
+
+        cached = self.image_prep.lookup(user_id, prepared.fingerprint)
+        if cached:
+            logger.info("[Sakiko] Reusing description of an identical image")
+            return cached
+
+        try:
+            path = self.temp_media.write(prepared.data, prepared.ext)
+        except TempMediaQuotaExceeded as e:
+            logger.warning(f"[Sakiko] Skipping image understanding: {e}")
+            return ""
+        try:
+            image_desc = self._understand_image(path)
+        finally:
+            self.temp_media.release(path)
+        if image_desc and not image_desc.startswith("（工具调用失败"):
+            self.image_prep.remember(user_id, prepared.fingerprint, image_desc)
+        return image_desc
+
     # ============================================================
     # Context Generation (Main Interface)
     # ============================================================
 
-    def generate_context_string(self, user_id: str, user_name: str, text: str, image_path: str = None) -> str:
+    def generate_context_string(self, user_id: str, user_name: str, text: str, image_path: str = None,
+                                session_id: str = None, transcript: str = None, group_id: str = None) -> str:
         """
         Generate injection context for AstrBot's native agent.
 
@@ -94,18 +211,32 @@ class SakikoAgent:
             user_id: User identifier
             user_name: User name
             text: User message text
-            image_path: Path to local image file (optional)
+            image_path: Local image path or binary file object (optional)
+            session_id: Conversation id; enables delta injection when tracked (optional)
+            transcript: Voice message transcript, used as the retrieval query (optional)
+            group_id: Group chat id; merges group memory into the context (optional)
 
         Returns:
-            Formatted context string to prepend to user's message
+            Formatted context string to prepend to user's message ("" if nothing new)
         """
         logger.info(f"[Sakiko] Generating context for user {user_id}, text: {text[:50] if text else '(no text)'}...")
+        memories = self.collect_memories(user_id, transcript or text, image_path, group_id=group_id)
+        return self.render_context(user_id, memories, session_id)
 
+    def collect_memories(self, user_id: str, text: str, image_path: str = None, include_insights: bool = True,
+                         group_id: str = None) -> dict:
+        """
+        IO 阶段：图像理解 + 记忆检索（在 IO 执行器中运行）
+
+        include_insights=False 时只取与查询无关的部分（profile、近期对话），
+        以便与语音转写并行，转写完成后再调用 add_insights。
+        给出 group_id 时附带群组上下文，并把群事实与个人记忆合并检索
+        """
         # === 图像理解 ===
         observation_parts = []
-        if image_path:
-            logger.info(f"[Sakiko] Understanding image: {image_path}")
-            image_desc = self._understand_image(image_path)
+        if image_path is not None:
+            logger.info("[Sakiko] Understanding image")
+            image_desc = self._describe_image(image_path, user_id)
             if image_desc:
                 observation_parts.append(f"【视觉数据】: {image_desc}")
                 logger.info(f"[Sakiko] Image description length: {len(image_desc)}")
@@ -113,11 +244,70 @@ class SakikoAgent:
         full_observation = "\n".join(observation_parts) if observation_parts else ""
 
         # === 检索记忆 ===
-        search_query = text if text else "image"
-        memories = self.memory.retrieve_all(user_id, search_query)
+        if include_insights:
+            search_query = text if text else "image"
+            memories = self.memory.retrieve_all(user_id, search_query, group_id=group_id)
+        else:
+            # 与 retrieve_all 一致：先记录活跃（归档用户随之回迁），再读取近期对话
+            self.memory.touch(user_id)
+            recent_entries = self.memory.get_recent_raw_entries(user_id, limit=5)
+            memories = {
+                "profile": self.memory.get_profile_summary(user_id),
+                "insights": [],
+                "recent_raw": "\n".join([item['content'] for item in recent_entries]),
+                "recent_entries": recent_entries
+            }
+            if group_id:
+                memories["group"] = self.memory.get_group_context(group_id)
+        group = memories.get("group")
+        if group and text:
+            # 本条消息可能已被记入近期群聊，避免与用户消息重复
+            group["recent_entries"] = [e for e in group["recent_entries"] if e["content"] != text]
+        _drop_summary_facts(memories)
         memories["observation"] = full_observation
+        return memories
+
+    def add_insights(self, user_id: str, memories: dict, query_text: str, group_id: str = None) -> dict:
+        """用（转写后的）查询文本补充长期记忆检索结果"""
+        memories["insights"] = (
+            self.memory.retrieve_insights(user_id, query_text, group_id=group_id) if query_text else []
+        )
+        _drop_summary_facts(memories)
+        return memories
+
+    def render_context(self, user_id: str, memories: dict, session_id: str = None) -> str:
+        """CPU 阶段：增量筛选、指纹计算与模板渲染（在 CPU 执行器中运行）"""
+        if self.tracker is not None and session_id:
+            group = memories.get("group") or {}
+            selection = self.tracker.select(
+                user_id, session_id,
+                profile_summary=memories.get("profile", ""),
+                profile_version=fingerprint(memories.get("profile", "")),
+                insights=memories.get("insights", []),
+                recent_entries=memories.get("recent_entries", []),
+                group_summary=group.get("summary", ""),
+                group_version=group.get("version"),
+                group_recent=group.get("recent_entries", [])
+            )
+            if not selection["full"]:
+                injection_text = self._render_delta(selection, memories.get("observation", ""))
+                metrics.observe("injection.chars", len(injection_text))
+                logger.info(f"[Sakiko] Delta context generated, length: {len(injection_text)} chars")
+                return injection_text
+
+        if self.injection_mode == INJECTION_MODE_PREFIX_STABLE:
+            injection_text = self._render_prefix_stable(memories)
+        else:
+            injection_text = self._render_legacy(memories)
+
+        self._record_prefix_stability(user_id, injection_text)
+        metrics.observe("injection.chars", len(injection_text))
+        logger.info(f"[Sakiko] Context generated, length: {len(injection_text)} chars")
+
+        return injection_text
 
-        # === 构建上下文 ===
+    def _render_legacy(self, memories: dict) -> str:
+        """原始布局：动态用户上下文夹在模板中间"""
         profile_summary = memories.get("profile", "（用户资料学习中...）")
         insights = memories.get("insights", [])
         insights_str = "\n".join(insights) if insights else "（暂无长期记忆）"
@@ -130,20 +320,98 @@ class SakikoAgent:
             memories=insights_str
         )]
 
+        group = memories.get("group") or {}
+        if group.get("summary"):
+            user_context_parts.append(f"\n### Group Context\n{group['summary']}")
+        if group.get("recent_entries"):
+            user_context_parts.append("\n" + GROUP_TURNS_TEMPLATE.format(
+                group_history=_format_group_turns(group["recent_entries"])
+            ))
+
         if observation:
             user_context_parts.append(f"\n### Visual/Observation Data\n{observation}")
 
         user_context = "\n".join(user_context_parts)
 
         # Build full injection context
-        injection_text = INJECTION_TEMPLATE.format(
+        return INJECTION_TEMPLATE.format(
             user_context=user_context,
             recent_history=recent_history
         )
 
-        logger.info(f"[Sakiko] Context generated, length: {len(injection_text)} chars")
+    def _render_prefix_stable(self, memories: dict) -> str:
+        """
+        前缀稳定布局：静态人设 -> 群组级（群摘要）-> 用户级（profile、insights）-> 回合级（近期对话、群聊、观察）
 
-        return injection_text
+        insights 按文本排序，避免检索打分的微小波动打乱用户级区块
+        """
+        insights = sorted(memories.get("insights", []) or [])
+        user_block = USER_BLOCK_TEMPLATE.format(
+            user_profile=memories.get("profile") or "（用户资料学习中...）",
+            memories="\n".join(insights) if insights else "（暂无长期记忆）"
+        )
+
+        group = memories.get("group") or {}
+        group_parts = []
+        if group.get("summary"):
+            group_parts.append(GROUP_BLOCK_TEMPLATE.format(group_summary=group["summary"]))
+
+        turn_parts = [TURN_BLOCK_TEMPLATE.format(
+            recent_history=memories.get("recent_raw") or "（无近期对话）"
+        )]
+        if group.get("recent_entries"):
+            turn_parts.append(GROUP_TURNS_TEMPLATE.format(
+                group_history=_format_group_turns(group["recent_entries"])
+            ))
+        observation = memories.get("observation", "")
+        if observation:
+            turn_parts.append(OBSERVATION_BLOCK_TEMPLATE.format(observation=observation))
+
+        return "\n\n".join([PERSONA_BLOCK, *group_parts, user_block, *turn_parts, RESPONSE_CUE])
+
+    def _render_delta(self, selection: dict, observation: str) -> str:
+        """增量布局：只包含本会话尚未注入过的内容，没有新内容时返回空串"""
+        parts = []
+        if selection.get("group"):
+            parts.append(DELTA_GROUP_TEMPLATE.format(group_summary=selection["group"]))
+        if selection["profile"]:
+            parts.append(DELTA_PROFILE_TEMPLATE.format(user_profile=selection["profile"]))
+        if selection["insights"]:
+            parts.append(DELTA_MEMORIES_TEMPLATE.format(memories="\n".join(selection["insights"])))
+        if selection["recent"]:
+            parts.append(DELTA_HISTORY_TEMPLATE.format(
+                recent_history="\n".join(item["content"] for item in selection["recent"])
+            ))
+        if selection.get("group_recent"):
+            parts.append(GROUP_TURNS_TEMPLATE.format(group_history=_format_group_turns(selection["group_recent"])))
+        if observation:
+            parts.append(OBSERVATION_BLOCK_TEMPLATE.format(observation=observation))
+
+        if not parts:
+            return ""
+        return "\n\n".join([DELTA_HEADER, *parts])
+
+    def on_command(self, command_text: str, session_id: str = None):
+        """新建 / 重置对话后，该会话的增量记录作废，下一轮全量注入"""
+        if self.tracker is None or not session_id:
+            return
+        name = command_text.lstrip("/").split(maxsplit=1)
+        if name and name[0].lower() in CONVERSATION_RESET_COMMANDS:
+            self.tracker.reset_prefix(session_id)
+            logger.info(f"[Sakiko] Delta injection reset for session {session_id}")
+
+    def _record_prefix_stability(self, user_id: str, injection_text: str):
+        """记录与上一轮注入文本的公共前缀占比（0~1），越高越容易命中 prompt 缓存"""
+        with self._injection_lock:
+            previous = self._last_injection.pop(user_id, None)
+            self._last_injection[user_id] = injection_text
+            while len(self._last_injection) > MAX_TRACKED_SESSIONS:
+                self._last_injection.popitem(last=False)
+        if previous is None or not injection_text:
+            return
+        shared = len(os.path.commonprefix([previous, injection_text]))
+        metrics.observe("injection.prefix_stability", shared / len(injection_text))
+        metrics.observe("injection.shared_prefix_chars", shared)
 
     # ============================================================
     # Logging Helper
@@ -179,9 +447,10 @@ class SakikoAgent:
     # ============================================================
 
     def get_status(self, user_id: str) -> str:
-        """获取状态面板"""
+        """获取状态面板（读取物化统计，O(1)）"""
         s = self.memory.get_state(user_id)
         profile = self.memory.get_user_profile(user_id)
+        stats = self.memory.get_memory_stats(user_id)
 
         # 构建 profile 显示
         profile_parts = []
@@ -190,14 +459,20 @@ class SakikoAgent:
         if profile.get("personality_traits"):
             profile_parts.append(f"性格: {', '.join(profile['personality_traits'][-3:])}")
 
-        get_history = getattr(self.memory, "get_recent_history", None)
-        memory_str = "\n".join(get_history(user_id, limit=5)) if get_history else "No Data"
+        recent = []
+        for ts, doc_type, content in stats.get("recent", []):
+            time_str = datetime.datetime.fromtimestamp(ts).strftime("%m-%d %H:%M")
+            type_hint = "💭" if doc_type == "raw" else "📌"
+            recent.append(f"{type_hint} [{time_str}] {content}")
+        memory_str = "\n".join(recent) if recent else "(暂无记忆)"
 
+        counts = stats.get("counts", {})
         return f"""
 📊 [Sakiko Status Panel]
 ------------------------
-🧠 待整理: {s.get('raw_count', 0)}
-📚 Insights: {s.get('insight_count', 0)}
+🧠 待整理: {counts.get('raw', s.get('raw_count', 0))}
+📚 Insights: {counts.get('insight', s.get('insight_count', 0))}
+💾 记忆体积: {stats.get('bytes', 0) / 1024:.1f} KB
 ⌚ 时间: {datetime.datetime.now().strftime("%H:%M")}
 
 🧬 [User Profile]
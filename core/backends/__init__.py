@@ -0,0 +1,39 @@
+# plugins/astrbot_plugin_ai_personality/core/backends/__init__.py
+# -*- coding: utf-8 -*-
+import os
+
+from .base import MemoryBackend
+
+BACKEND_CHROMA = "chroma"
+BACKEND_NUMPY = "numpy"
+LOCK_FILE = "memory.lock"
+
+
+def create_backend(kind, data_dir, quantization="float16"):
+    """按配置创建存储后端；各实现按需导入，未使用的后端无需安装其依赖"""
+    if kind == BACKEND_NUMPY:
+        from .numpy_backend import NumpyBackend
+        return NumpyBackend(data_dir, quantization=quantization)
+    if kind == BACKEND_CHROMA:
+        from .chroma_backend import ChromaBackend
+        return ChromaBackend(data_dir)
+    raise ValueError(f"unknown memory backend: {kind}")
+
+
+def lock_data_dir(data_dir, exclusive=False):
+    """
+    对数据目录加 flock：运行中的 bot / 记忆服务持有共享锁，离线维护（压缩替换）需要独占锁。
+    锁被占用时抛出 BlockingIOError；平台不支持 flock 时返回 None。
+    返回的文件对象需在进程存活期间保持打开。
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    f = open(os.path.join(data_dir, LOCK_FILE), "a")
+    try:
+        fcntl.flock(f, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        raise
+    return f
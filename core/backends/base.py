@@ -0,0 +1,51 @@
+# plugins/astrbot_plugin_ai_personality/core/backends/base.py
+# -*- coding: utf-8 -*-
+"""
+MemoryBackend interface.
+
+MemoryManager 通过该接口读写向量记忆。返回结构与 Chroma 保持一致，
+方便上层代码在不同后端之间无感切换：
+- get()   -> {"ids": [...], "documents": [...], "metadatas": [...], "embeddings": [...]?}
+- query() -> {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}
+
+where 过滤只使用等值条件及其 "$and" 组合，例如
+{"$and": [{"user_id": "123"}, {"type": "insight"}]}
+"""
+
+
+class MemoryBackend:
+    name = "base"
+
+    def add(self, ids, documents, metadatas, embeddings):
+        raise NotImplementedError
+
+    def get(self, where=None, ids=None, limit=None, offset=None, include=("documents", "metadatas")):
+        raise NotImplementedError
+
+    def query(self, query_embeddings, n_results, where=None):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+
+def flatten_where(where):
+    """把等值 where 条件展开为 {field: value}"""
+    if not where:
+        return {}
+    if "$and" in where:
+        merged = {}
+        for clause in where["$and"]:
+            merged.update(flatten_where(clause))
+        return merged
+    conditions = {}
+    for key, value in where.items():
+        if isinstance(value, dict):
+            if set(value) != {"$eq"}:
+                raise ValueError(f"unsupported where operator: {value}")
+            value = value["$eq"]
+        conditions[key] = value
+    return conditions
@@ -0,0 +1,46 @@
+# plugins/astrbot_plugin_ai_personality/core/backends/chroma_backend.py
+# -*- coding: utf-8 -*-
+import os
+import chromadb
+from ..log import logger
+
+from .base import MemoryBackend
+
+COLLECTION_NAME = "soulmate_memory"
+
+
+class ChromaBackend(MemoryBackend):
+    """原有的 ChromaDB 持久化存储"""
+    name = "chroma"
+
+    def __init__(self, data_dir, collection_name=COLLECTION_NAME):
+        self.chroma_path = os.path.join(data_dir, "chromadb")
+        self.collection_name = collection_name
+
+        logger.info(f"[Sakiko Memory] ChromaDB Path: {self.chroma_path}")
+        try:
+            self.chroma = chromadb.PersistentClient(path=self.chroma_path)
+        except Exception as e:
+            logger.error(f"[Sakiko Memory] DB Init Failed: {e}")
+            if "readonly" in str(e):
+                logger.error("!!! 请在宿主机执行: sudo chmod -R 777 ./data/soulmate_data !!!")
+            raise e
+
+    @property
+    def collection(self):
+        return self.chroma.get_or_create_collection(self.collection_name)
+
+    def add(self, ids, documents, metadatas, embeddings):
+        self.collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def get(self, where=None, ids=None, limit=None, offset=None, include=("documents", "metadatas")):
+        return self.collection.get(ids=ids, where=where, limit=limit, offset=offset, include=list(include))
+
+    def query(self, query_embeddings, n_results, where=None):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def count(self):
+        return self.collection.count()
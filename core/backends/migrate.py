@@ -0,0 +1,69 @@
+# plugins/astrbot_plugin_ai_personality/core/backends/migrate.py
+# -*- coding: utf-8 -*-
+"""
+在两个存储后端之间迁移记忆（原样复制向量，不重新嵌入）：
+
+    python -m astrbot_plugin_ai_personality.core.backends.migrate --source chroma --target numpy
+
+迁移期间持有数据目录的独占锁：bot / 记忆服务运行时会用缓存的旧分区覆盖迁移写入的记录。
+"""
+import sys
+import time
+import argparse
+
+from ..log import logger
+from . import create_backend, lock_data_dir, BACKEND_CHROMA, BACKEND_NUMPY
+
+DEFAULT_DATA_DIR = "/AstrBot/data/soulmate_data"
+DEFAULT_PAGE_SIZE = 256
+
+
+def migrate(source, target, page_size=DEFAULT_PAGE_SIZE):
+    """按页从 source 读取并写入 target，返回迁移条数"""
+    moved = 0
+    offset = 0
+    start = time.perf_counter()
+    while True:
+        page = source.get(limit=page_size, offset=offset, include=("documents", "metadatas", "embeddings"))
+        ids = page["ids"]
+        if not ids:
+            break
+        target.add(ids=ids, documents=page["documents"], metadatas=page["metadatas"], embeddings=page["embeddings"])
+        moved += len(ids)
+        offset += len(ids)
+        logger.info(f"[Sakiko Migrate] {moved} records ({moved / max(time.perf_counter() - start, 1e-6):.0f}/s)")
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate soulmate memories between storage backends")
+    parser.add_argument("--source", choices=[BACKEND_CHROMA, BACKEND_NUMPY], required=True)
+    parser.add_argument("--target", choices=[BACKEND_CHROMA, BACKEND_NUMPY], required=True)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--quantization", choices=["float16", "int8"], default="float16")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    if args.source == args.target:
+        parser.error("source and target must differ")
+
+    try:
+        lock = lock_data_dir(args.data_dir, exclusive=True)
+    except BlockingIOError:
+        print(f"error: {args.data_dir} is in use; stop the bot and the memory service before migrating",
+              file=sys.stderr)
+        sys.exit(2)
+    try:
+        source = create_backend(args.source, args.data_dir, quantization=args.quantization)
+        target = create_backend(args.target, args.data_dir, quantization=args.quantization)
+        if target.count():
+            logger.warning(f"[Sakiko Migrate] Target backend already holds {target.count()} records")
+        moved = migrate(source, target, page_size=args.page_size)
+    finally:
+        if lock is not None:
+            lock.close()
+    print(f"Migrated {moved} records from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+# plugins/astrbot_plugin_ai_personality/core/backends/numpy_backend.py
+# -*- coding: utf-8 -*-
+"""
+Compact in-process vector store.
+
+每个用户一个目录：
+├── vectors.<gen>.npy   连续的 float16 / int8 量化向量（内存映射读取）
+├── scales.<gen>.npy    int8 量化时每行的缩放系数
+├── meta.<gen>.json     与向量行一一对应的 id / document / metadata
+└── current.json        {"generation": gen, "count": n}，最后原子写入
+
+每次写入生成新一代文件，current.json 替换成功才算提交；中途崩溃时读到的仍是上一代完整数据。
+读取时行数不一致视为损坏并报错，绝不把向量与错位的记录拼在一起。
+
+向量写入前做 L2 归一化，查询时用一次向量化点积求余弦相似度，再精确取 top-k。
+单用户只有几百条记忆时，这比 Chroma 的 SQLite + HNSW 轻得多。
+"""
+import os
+import json
+import uuid
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from ..log import logger
+
+from .base import MemoryBackend, flatten_where
+
+CURRENT_FILE = "current.json"
+QUANT_FLOAT16 = "float16"
+QUANT_INT8 = "int8"
+MAX_CACHED_PARTITIONS = 1024
+
+
+class CorruptPartitionError(RuntimeError):
+    pass
+
+
+class _Partition:
+    __slots__ = ("vectors", "scales", "records")
+
+    def __init__(self, vectors, scales, records):
+        self.vectors = vectors
+        self.scales = scales
+        self.records = records
+
+    def dequantize(self, rows=None):
+        vecs = self.vectors if rows is None else self.vectors[rows]
+        out = np.asarray(vecs, dtype=np.float32)
+        if self.scales is not None:
+            scales = self.scales if rows is None else self.scales[rows]
+            out = out * scales[:, None]
+        return out
+
+
+class NumpyBackend(MemoryBackend):
+    name = "numpy"
+
+    def __init__(self, data_dir, quantization=QUANT_FLOAT16, store_name="numpy_store"):
+        if quantization not in (QUANT_FLOAT16, QUANT_INT8):
+            raise ValueError(f"unsupported quantization: {quantization}")
+        self.root = os.path.join(data_dir, store_name)
+        self.quantization = quantization
+        os.makedirs(self.root, exist_ok=True)
+        self._cache = OrderedDict()
+        self._id_index = None
+        self._lock = threading.RLock()
+        logger.info(f"[Sakiko Memory] NumPy store: {self.root} ({quantization})")
+
+    # ============================================================
+    # Partition IO
+    # ============================================================
+
+    @staticmethod
+    def _key(user_id):
+        return str(user_id).encode("utf-8").hex()
+
+    def _dir(self, key):
+        return os.path.join(self.root, key)
+
+    def _user_keys(self):
+        try:
+            return sorted(name for name in os.listdir(self.root) if os.path.isdir(self._dir(name)))
+        except FileNotFoundError:
+            return []
+
+    def _load(self, key):
+        with self._lock:
+            part = self._cache.get(key)
+            if part is not None:
+                self._cache.move_to_end(key)
+                return part
+
+            path = self._dir(key)
+            current_path = os.path.join(path, CURRENT_FILE)
+            if os.path.exists(current_path):
+                with open(current_path, "r", encoding="utf-8") as f:
+                    current = json.load(f)
+                gen, expected = current["generation"], current["count"]
+                names = (f"vectors.{gen}.npy", f"scales.{gen}.npy", f"meta.{gen}.json")
+            elif os.path.exists(os.path.join(path, "meta.json")):
+                # 旧版布局（无代号），下次写入时迁移
+                gen, expected = None, None
+                names = ("vectors.npy", "scales.npy", "meta.json")
+            else:
+                return None
+
+            with open(os.path.join(path, names[2]), "r", encoding="utf-8") as f:
+                records = json.load(f)
+            vectors = np.load(os.path.join(path, names[0]), mmap_mode="r")
+            scales_path = os.path.join(path, names[1])
+            scales = np.load(scales_path) if os.path.exists(scales_path) else None
+
+            lengths = {len(records), len(vectors)} | ({len(scales)} if scales is not None else set())
+            if expected is not None:
+                lengths.add(expected)
+            if len(lengths) != 1:
+                raise CorruptPartitionError(
+                    f"partition {path} (generation {gen}) is inconsistent: "
+                    f"{len(records)} records, {len(vectors)} vectors; restore it from an export"
+                )
+            part = _Partition(vectors, scales, records)
+            self._cache[key] = part
+            while len(self._cache) > MAX_CACHED_PARTITIONS:
+                self._cache.popitem(last=False)
+            return part
+
+    def _save(self, key, vectors, scales, records):
+        path = self._dir(key)
+        if not records:
+            shutil.rmtree(path, ignore_errors=True)
+            self._cache.pop(key, None)
+            return
+
+        os.makedirs(path, exist_ok=True)
+        gen = uuid.uuid4().hex[:12]
+        self._atomic_npy(os.path.join(path, f"vectors.{gen}.npy"), vectors)
+        if scales is not None:
+            self._atomic_npy(os.path.join(path, f"scales.{gen}.npy"), scales)
+        tmp = os.path.join(path, f"meta.{gen}.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, os.path.join(path, f"meta.{gen}.json"))
+
+        # 提交点：current.json 指向新一代
+        tmp = os.path.join(path, CURRENT_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": gen, "count": len(records)}, f)
+        os.replace(tmp, os.path.join(path, CURRENT_FILE))
+        self._cache.pop(key, None)
+
+        # 清理旧代文件（已打开的内存映射在 Linux 下仍然有效）
+        for name in os.listdir(path):
+            if name != CURRENT_FILE and f".{gen}." not in name:
+                try: os.remove(os.path.join(path, name))
+                except OSError: pass
+
+    @staticmethod
+    def _atomic_npy(path, array):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+
+    def _quantize(self, embeddings):
+        vecs = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.maximum(norms, 1e-12)
+        if self.quantization == QUANT_INT8:
+            scales = np.maximum(np.abs(vecs).max(axis=1), 1e-12) / 127.0
+            return np.round(vecs / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vecs.astype(np.float16), None
+
+    def _index(self):
+        """id -> user key，首次删除 / 按 id 读取时构建"""
+        with self._lock:
+            if self._id_index is None:
+                index = {}
+                for key in self._user_keys():
+                    part = self._load(key)
+                    if part is not None:
+                        for rec in part.records:
+                            index[rec["id"]] = key
+                self._id_index = index
+            return self._id_index
+
+    # ============================================================
+    # MemoryBackend API
+    # ============================================================
+
+    def add(self, ids, documents, metadatas, embeddings):
+        """写入记录；已存在的 id 原地替换（与 Chroma upsert 语义一致），重复导入 / 回迁是幂等的"""
+        latest = OrderedDict()
+        for i, mem_id in enumerate(ids):
+            latest.pop(mem_id, None)
+            latest[mem_id] = i
+        grouped = OrderedDict()
+        for i in latest.values():
+            grouped.setdefault(self._key(metadatas[i].get("user_id", "")), []).append(i)
+
+        with self._lock:
+            # 已知 id 若属于其他分区（user_id 变更），先从原分区移除
+            if self._id_index is not None:
+                moved = [ids[i] for key, rows in grouped.items() for i in rows
+                         if self._id_index.get(ids[i], key) != key]
+                if moved:
+                    self.delete(moved)
+
+            for key, rows in grouped.items():
+                new_vecs, new_scales = self._quantize([embeddings[i] for i in rows])
+                new_records = [{"id": ids[i], "document": documents[i], "metadata": metadatas[i]} for i in rows]
+
+                part = self._load(key)
+                if part is not None and len(part.records):
+                    vectors, scales = np.array(part.vectors), (
+                        np.array(part.scales) if part.scales is not None else None)
+                    if vectors.dtype != new_vecs.dtype:
+                        # 量化方式变更后按新格式重写整个分区
+                        vectors, scales = self._quantize(part.dequantize())
+                    records = list(part.records)
+                    position = {rec["id"]: row for row, rec in enumerate(records)}
+                    append = []
+                    for j, rec in enumerate(new_records):
+                        row = position.get(rec["id"])
+                        if row is None:
+                            append.append(j)
+                            continue
+                        vectors[row] = new_vecs[j]
+                        if scales is not None:
+                            scales[row] = new_scales[j]
+                        records[row] = rec
+                    if append:
+                        vectors = np.concatenate([vectors, new_vecs[append]])
+                        if scales is not None:
+                            scales = np.concatenate([scales, new_scales[append]])
+                        records.extend(new_records[j] for j in append)
+                else:
+                    vectors, scales, records = new_vecs, new_scales, new_records
+                self._save(key, vectors, scales, records)
+
+                if self._id_index is not None:
+                    for rec in new_records:
+                        self._id_index[rec["id"]] = key
+
+    def _select(self, key, conditions):
+        part = self._load(key)
+        if part is None:
+            return None, []
+        rows = [i for i, rec in enumerate(part.records)
+                if all(rec["metadata"].get(k) == v for k, v in conditions.items())]
+        return part, rows
+
+    def get(self, where=None, ids=None, limit=None, offset=None, include=("documents", "metadatas")):
+        with self._lock:
+            conditions = flatten_where(where)
+            user_id = conditions.pop("user_id", None)
+            want_embeddings = "embeddings" in include
+            out = {"ids": [], "documents": [], "metadatas": []}
+            if want_embeddings:
+                out["embeddings"] = []
+
+            if ids is not None:
+                index = self._index()
+                keys = list(dict.fromkeys(index[i] for i in ids if i in index))
+                wanted = set(ids)
+            else:
+                keys = [self._key(user_id)] if user_id is not None else self._user_keys()
+                wanted = None
+
+            skip = offset or 0
+            for key in keys:
+                part, rows = self._select(key, conditions)
+                if wanted is not None:
+                    rows = [i for i in rows if part.records[i]["id"] in wanted]
+                if skip >= len(rows):
+                    skip -= len(rows)
+                    continue
+                rows = rows[skip:]
+                skip = 0
+                if limit is not None:
+                    rows = rows[:limit - len(out["ids"])]
+                for i in rows:
+                    rec = part.records[i]
+                    out["ids"].append(rec["id"])
+                    out["documents"].append(rec["document"])
+                    out["metadatas"].append(rec["metadata"])
+                if want_embeddings and rows:
+                    out["embeddings"].extend(part.dequantize(rows).tolist())
+                if limit is not None and len(out["ids"]) >= limit:
+                    break
+            return out
+
+    def query(self, query_embeddings, n_results, where=None):
+        conditions = flatten_where(where)
+        user_id = conditions.pop("user_id", None)
+        keys = [self._key(user_id)] if user_id is not None else self._user_keys()
+
+        candidates = []
+        with self._lock:
+            for key in keys:
+                part, rows = self._select(key, conditions)
+                if rows:
+                    candidates.append((part, rows))
+
+        m = len(query_embeddings)
+        out = {"ids": [[] for _ in range(m)], "documents": [[] for _ in range(m)],
+               "metadatas": [[] for _ in range(m)], "distances": [[] for _ in range(m)]}
+        if not candidates:
+            return out
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        matrix = np.concatenate([part.dequantize(rows) for part, rows in candidates])
+        records = [part.records[i] for part, rows in candidates for i in rows]
+
+        scores = queries @ matrix.T
+        k = min(n_results, len(records))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for qi in range(m):
+            order = top[qi][np.argsort(-scores[qi, top[qi]])]
+            for j in order:
+                rec = records[j]
+                out["ids"][qi].append(rec["id"])
+                out["documents"][qi].append(rec["document"])
+                out["metadatas"][qi].append(rec["metadata"])
+                out["distances"][qi].append(float(1.0 - scores[qi, j]))
+        return out
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            index = self._index()
+            by_key = {}
+            for i in ids:
+                if i in index:
+                    by_key.setdefault(index.pop(i), set()).add(i)
+            for key, doomed in by_key.items():
+                part = self._load(key)
+                if part is None:
+                    continue
+                keep = [i for i, rec in enumerate(part.records) if rec["id"] not in doomed]
+                vectors = np.asarray(part.vectors)[keep]
+                scales = part.scales[keep] if part.scales is not None else None
+                self._save(key, vectors, scales, [part.records[i] for i in keep])
+
+    def count(self):
+        total = 0
+        for key in self._user_keys():
+            part = self._load(key)
+            if part is not None:
+                total += len(part.records)
+        return total
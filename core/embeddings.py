@@ -0,0 +1,34 @@
+# plugins/astrbot_plugin_ai_personality/core/embeddings.py
+# -*- coding: utf-8 -*-
+"""
+Embedding function selection.
+
+写入与查询必须使用同一个模型：运行时（MemoryManager / 记忆服务）与维护工具都通过
+config.json 的 embedding_model 选择模型，留空时使用 Chroma 默认模型。
+"""
+import os
+import json
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_embedding_function(model_name=""):
+    from chromadb.utils import embedding_functions
+    if model_name:
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+def configured_model(plugin_dir=PLUGIN_DIR):
+    """
+    读取插件配置中的 embedding_model（供独立运行的 CLI 使用），
+    与 PluginConfig.embedding_model 相同的优先级：环境变量 > config.json > 默认模型
+    """
+    env = os.getenv("SAKIKO_EMBEDDING_MODEL")
+    if env:
+        return env
+    try:
+        with open(os.path.join(plugin_dir, "config.json"), "r", encoding="utf-8") as f:
+            return json.load(f).get("embedding_model", "") or ""
+    except (OSError, ValueError):
+        return ""
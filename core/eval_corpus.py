@@ -0,0 +1,120 @@
+# plugins/astrbot_plugin_ai_personality/core/eval_corpus.py
+# -*- coding: utf-8 -*-
+"""
+Labelled synthetic memory corpus for the retrieval evaluation harness.
+
+每个主题包含若干条中英混合的记忆与查询；同一用户下同主题的记忆即为该查询的相关记忆。
+build_corpus() 按固定规则为多个虚拟用户组合主题，结果完全确定。
+给出 group_id 时，GROUP_TOPICS 中的主题改为群事实（只存一份），只能经群事实合并检索到。
+"""
+from .group_memory import group_key
+
+TOPICS = {
+    "work": {
+        "memories": [
+            "用户最近在赶一个项目 demo，每天加班到很晚",
+            "用户说老板总是临时塞急活，deadline 很紧",
+            "User works as a backend engineer and is on call this week",
+            "用户抱怨上班通勤要一个半小时",
+        ],
+        "queries": ["今天又要加班，好累", "项目 deadline 快到了", "I have so much work to do"],
+    },
+    "fatigue": {
+        "memories": [
+            "用户经常熬夜，白天很困没精神",
+            "用户说最近睡眠质量差，总是疲惫",
+            "User mentioned feeling exhausted after long weeks",
+        ],
+        "queries": ["好困啊没精神", "最近总是很疲劳", "I'm so tired lately"],
+    },
+    "food": {
+        "memories": [
+            "用户最喜欢吃草莓蛋糕和抹茶甜点",
+            "用户不吃香菜，讨厌香菜的味道",
+            "User loves ramen and tries a new ramen shop every month",
+        ],
+        "queries": ["晚饭吃什么好呢", "推荐点甜点吧", "any good ramen places?"],
+    },
+    "music": {
+        "memories": [
+            "用户在学钢琴，正在练肖邦的夜曲",
+            "用户是乐队的键盘手，每周六排练",
+            "User listens to city pop and jazz while coding",
+        ],
+        "queries": ["今天练琴练了好久", "乐队排练好难", "what music should I listen to"],
+    },
+    "pets": {
+        "memories": [
+            "用户养了一只叫团子的橘猫",
+            "团子最近挑食，用户很担心",
+            "User is thinking about adopting a shiba inu",
+        ],
+        "queries": ["我家猫又不吃饭了", "团子今天好可爱", "should I get a dog"],
+    },
+    "travel": {
+        "memories": [
+            "用户计划下个月去京都看红叶",
+            "用户去年一个人去了冰岛看极光",
+            "User prefers window seats on long flights",
+        ],
+        "queries": ["想出去旅行散散心", "京都有什么好玩的", "booking flights for my trip"],
+    },
+    "study": {
+        "memories": [
+            "用户在准备日语 N1 考试",
+            "用户每天早上背 50 个单词",
+            "User is taking an online machine learning course",
+        ],
+        "queries": ["日语考试好难准备", "背单词背不下去了", "my ML course homework is hard"],
+    },
+    "family": {
+        "memories": [
+            "用户的妈妈下周生日，用户在想送什么礼物",
+            "用户和妹妹关系很好，经常一起打游戏",
+            "User calls their parents every Sunday evening",
+        ],
+        "queries": ["给妈妈买什么生日礼物", "和妹妹又吵架了", "talked to my parents today"],
+    },
+}
+
+# 每个虚拟用户拥有的主题（互相交叠，制造跨用户干扰）
+USER_TOPICS = {
+    "u1": ["work", "fatigue", "food", "music", "pets"],
+    "u2": ["work", "travel", "study", "family"],
+    "u3": ["fatigue", "food", "pets", "travel", "study", "family"],
+    "u4": ["music", "work", "family"],
+}
+
+# 群组评测中作为群事实存放的主题
+GROUP_TOPICS = ("food", "travel")
+
+
+def build_corpus(group_id=None):
+    """
+    Returns:
+        memories: [{"id", "user_id", "document", "topic"}]（群事实的 user_id 为 group:<id>）
+        queries:  [{"user_id", "group_id", "text", "relevant": set(ids)}]
+    """
+    memories, queries = [], []
+    group_ids = {}
+    for user_id, topics in USER_TOPICS.items():
+        for topic in topics:
+            spec = TOPICS[topic]
+            if group_id and topic in GROUP_TOPICS:
+                if topic not in group_ids:
+                    group_ids[topic] = set()
+                    for i, doc in enumerate(spec["memories"]):
+                        mem_id = f"group-{topic}-{i}"
+                        group_ids[topic].add(mem_id)
+                        memories.append({"id": mem_id, "user_id": group_key(group_id), "document": doc,
+                                         "topic": topic})
+                ids = group_ids[topic]
+            else:
+                ids = set()
+                for i, doc in enumerate(spec["memories"]):
+                    mem_id = f"{user_id}-{topic}-{i}"
+                    ids.add(mem_id)
+                    memories.append({"id": mem_id, "user_id": user_id, "document": doc, "topic": topic})
+            for text in spec["queries"]:
+                queries.append({"user_id": user_id, "group_id": group_id, "text": text, "relevant": ids})
+    return memories, queries
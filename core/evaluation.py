@@ -0,0 +1,214 @@
+# plugins/astrbot_plugin_ai_personality/core/evaluation.py
+# -*- coding: utf-8 -*-
+"""
+Retrieval quality-vs-latency evaluation harness.
+
+用带标注的合成语料（core/eval_corpus.py）评估不同检索配置的 recall@k、MRR 与延迟分位数。
+查询走线上的真实路径（MemoryManager.retrieve_insights：微批处理、群事实合并），
+embedding 使用注入的确定性本地函数，无需联网，也不需要安装 AstrBot：
+
+    python -m astrbot_plugin_ai_personality.core.evaluation
+    python -m astrbot_plugin_ai_personality.core.evaluation --min-recall 0.6 --min-mrr 0.9 --max-p95-ms 10
+    python -m astrbot_plugin_ai_personality.core.evaluation --save baseline.json
+    python -m astrbot_plugin_ai_personality.core.evaluation --baseline baseline.json --tolerance 0.02
+
+不带参数时对 --gate 配置使用默认门限（DEFAULT_MIN_RECALL 等，按实测值留出余量），
+任一门限不满足或相对 baseline 退化时以非零状态码退出。
+"""
+import re
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import argparse
+
+import numpy as np
+
+from .backends import BACKEND_CHROMA, BACKEND_NUMPY
+from .eval_corpus import build_corpus
+from .group_memory import group_key
+from .memory import MemoryManager
+from .metrics import _percentile
+from .retrieval import enhance_query
+
+EVAL_GROUP_ID = "eval"
+
+# 默认门限：numpy-f16-k5 实测 recall 0.53、MRR 0.86、p95 约 1ms，延迟留足 CI 机器的波动余量
+DEFAULT_MIN_RECALL = 0.5
+DEFAULT_MIN_MRR = 0.8
+DEFAULT_MAX_P95_MS = 20.0
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+|[\u4e00-\u9fff]+")
+
+
+class HashingEmbeddingFunction:
+    """
+    确定性的本地 embedding：英文按词、中文按单字 + 双字切分，哈希到固定维度并 L2 归一化。
+    与 Chroma embedding function 的调用方式一致：callable(list[str]) -> list[vector]
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _tokens(self, text):
+        for run in _TOKEN_RE.findall(text):
+            if run.isascii():
+                yield run.lower()
+                continue
+            yield from run
+            for i in range(len(run) - 1):
+                yield run[i:i + 2]
+
+    def __call__(self, texts):
+        out = []
+        for text in texts:
+            vec = np.zeros(self.dim, dtype=np.float32)
+            for token in self._tokens(text):
+                h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+                vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+            norm = np.linalg.norm(vec)
+            out.append(vec / norm if norm else vec)
+        return out
+
+
+# batch: 是否经过 RetrievalBatcher；group: 部分主题作为群事实，查询时与个人记忆合并检索
+DEFAULT_CONFIGS = [
+    {"name": "numpy-f16-k3", "backend": BACKEND_NUMPY, "quantization": "float16", "k": 3},
+    {"name": "numpy-f16-k5", "backend": BACKEND_NUMPY, "quantization": "float16", "k": 5},
+    {"name": "numpy-f16-k5-expand", "backend": BACKEND_NUMPY, "quantization": "float16", "k": 5, "expand": True},
+    {"name": "numpy-f16-k5-nobatch", "backend": BACKEND_NUMPY, "quantization": "float16", "k": 5, "batch": False},
+    {"name": "numpy-f16-k5-group", "backend": BACKEND_NUMPY, "quantization": "float16", "k": 5, "group": True},
+    {"name": "numpy-int8-k5", "backend": BACKEND_NUMPY, "quantization": "int8", "k": 5},
+    {"name": "chroma-k5", "backend": BACKEND_CHROMA, "quantization": "float16", "k": 5},
+]
+
+
+def evaluate(config, embed_fn):
+    """在临时目录中构建 MemoryManager 并经 retrieve_insights 跑完所有查询，返回指标字典"""
+    group_id = EVAL_GROUP_ID if config.get("group") else None
+    memories, queries = build_corpus(group_id)
+    # retrieve_insights 返回文档文本，按 (user_id, 文档) 映射回带标注的 id
+    id_of = {(m["user_id"], m["document"]): m["id"] for m in memories}
+
+    with tempfile.TemporaryDirectory(prefix="sakiko_eval_") as data_dir:
+        manager = MemoryManager(
+            None,
+            data_dir=data_dir,
+            backend=config["backend"],
+            quantization=config["quantization"],
+            batch_max_size=16 if config.get("batch", True) else 1,
+            embed_fn=embed_fn
+        )
+        try:
+            # 语料直接写入存储后端（保留标注 id），查询走线上路径
+            manager.store.add(
+                ids=[m["id"] for m in memories],
+                documents=[m["document"] for m in memories],
+                metadatas=[{"user_id": m["user_id"], "type": "insight", "timestamp": str(i)}
+                           for i, m in enumerate(memories)],
+                embeddings=[v.tolist() for v in embed_fn([m["document"] for m in memories])]
+            )
+
+            k = config["k"]
+            recalls, reciprocal_ranks, latencies = [], [], []
+            for q in queries:
+                start = time.perf_counter()
+                text = (enhance_query(q["text"]) or q["text"]) if config.get("expand") else q["text"]
+                documents = manager.retrieve_insights(q["user_id"], text, n_results=k, group_id=q["group_id"])
+                latencies.append((time.perf_counter() - start) * 1000)
+
+                owners = [q["user_id"]] + ([group_key(q["group_id"])] if q["group_id"] else [])
+                retrieved = [next((id_of[(owner, doc)] for owner in owners if (owner, doc) in id_of), None)
+                             for doc in documents]
+                relevant = q["relevant"]
+                recalls.append(len(relevant.intersection(retrieved)) / len(relevant))
+                rank = next((i + 1 for i, mem_id in enumerate(retrieved) if mem_id in relevant), None)
+                reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        finally:
+            manager.close()
+
+    latencies.sort()
+    return {
+        "name": config["name"],
+        "recall": sum(recalls) / len(recalls),
+        "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks),
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "k": config["k"],
+    }
+
+
+def format_table(results):
+    header = f"{'config':<22} {'recall@k':>9} {'MRR':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(f"{r['name']:<22} {r['recall']:>9.3f} {r['mrr']:>7.3f} "
+                     f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+    return "\n".join(lines)
+
+
+def check(results, gate=None, min_recall=None, min_mrr=None, max_p95_ms=None, baseline=None, tolerance=0.02):
+    """返回失败原因列表；为空表示通过"""
+    failures = []
+    by_name = {r["name"]: r for r in results}
+
+    gated = [by_name[gate]] if gate in by_name else results
+    for r in gated:
+        if min_recall is not None and r["recall"] < min_recall:
+            failures.append(f"{r['name']}: recall {r['recall']:.3f} < {min_recall}")
+        if min_mrr is not None and r["mrr"] < min_mrr:
+            failures.append(f"{r['name']}: MRR {r['mrr']:.3f} < {min_mrr}")
+        if max_p95_ms is not None and r["p95_ms"] > max_p95_ms:
+            failures.append(f"{r['name']}: p95 {r['p95_ms']:.2f}ms > {max_p95_ms}ms")
+
+    for old in baseline or []:
+        new = by_name.get(old["name"])
+        if new is None:
+            continue
+        for metric in ("recall", "mrr"):
+            if new[metric] < old[metric] - tolerance:
+                failures.append(f"{new['name']}: {metric} regressed {old[metric]:.3f} -> {new[metric]:.3f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality vs latency")
+    parser.add_argument("--configs", nargs="*", help="subset of config names to run")
+    parser.add_argument("--gate", default="numpy-f16-k5", help="config the absolute thresholds apply to")
+    parser.add_argument("--min-recall", type=float, default=DEFAULT_MIN_RECALL)
+    parser.add_argument("--min-mrr", type=float, default=DEFAULT_MIN_MRR)
+    parser.add_argument("--max-p95-ms", type=float, default=DEFAULT_MAX_P95_MS)
+    parser.add_argument("--baseline", help="JSON results from a previous --save run")
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    parser.add_argument("--save", help="write results as JSON")
+    args = parser.parse_args()
+
+    configs = [c for c in DEFAULT_CONFIGS if not args.configs or c["name"] in args.configs]
+    embed_fn = HashingEmbeddingFunction()
+
+    results = []
+    for config in configs:
+        try:
+            results.append(evaluate(config, embed_fn))
+        except ImportError as e:
+            print(f"skip {config['name']}: {e}", file=sys.stderr)
+
+    print(format_table(results))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    failures = check(results, args.gate, args.min_recall, args.min_mrr, args.max_p95_ms, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# plugins/astrbot_plugin_ai_personality/core/executors.py
+# -*- coding: utf-8 -*-
+"""
+Plugin-owned bounded executors.
+
+asyncio.to_thread 使用的默认线程池被 AstrBot 所有插件共享，且队列无上限。
+这里为插件单独维护线程池，并限制 "执行中 + 排队中" 的任务总数；
+超出上限时立即抛出 ExecutorSaturated，由调用方降级处理（例如不注入直接放行）。
+"""
+import time
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import metrics
+
+
+class ExecutorSaturated(RuntimeError):
+    """执行器排队已满，本次任务被丢弃"""
+
+
+class BoundedExecutor:
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"sakiko-{name}")
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._running = 0
+
+    def _admit(self):
+        with self._lock:
+            if self._inflight >= self.max_workers + self.max_queue:
+                return False
+            self._inflight += 1
+            self._publish_depth()
+            return True
+
+    def _publish_depth(self):
+        metrics.set_gauge(f"executor.{self.name}.queue_depth", self._inflight - self._running)
+        metrics.set_gauge(f"executor.{self.name}.running", self._running)
+
+    def _invoke(self, submitted_at, fn, args, kwargs):
+        metrics.observe(f"executor.{self.name}.wait_ms", (time.perf_counter() - submitted_at) * 1000)
+        with self._lock:
+            self._running += 1
+            self._publish_depth()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._inflight -= 1
+                self._publish_depth()
+
+    async def run(self, fn, *args, **kwargs):
+        """在本执行器中运行同步函数；队列已满时抛出 ExecutorSaturated"""
+        if not self._admit():
+            metrics.incr(f"executor.{self.name}.shed")
+            raise ExecutorSaturated(f"{self.name} executor saturated")
+        call = functools.partial(self._invoke, time.perf_counter(), fn, args, kwargs)
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._pool, call)
+        except Exception:
+            # 提交失败（例如执行器已关闭）时 _invoke 不会执行，这里归还名额
+            with self._lock:
+                self._inflight -= 1
+                self._publish_depth()
+            raise
+        return await future
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,240 @@
+# plugins/astrbot_plugin_ai_personality/core/group_memory.py
+# -*- coding: utf-8 -*-
+"""
+Group-level shared memory.
+
+与用户层并列的群组层，按群 / 会话 id 组织：
+- facts:  群内共识、约定等长期事实，存放在向量库中（user_id 为 "group:<id>"，type 为 insight），
+          因此检索、统计、微批处理与用户层完全共用
+- topics: 群内正在进行的话题（有上限，最近出现的排在后面）
+- recent: 最近若干条群聊发言（仅内存 + 定期持久化，不做向量化）
+
+群摘要（话题 + 最近的事实）带版本号，只有话题或事实变化时才重算，
+同一群内所有成员的注入复用同一份摘要文本。
+"""
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+
+from .log import logger
+from .metrics import metrics
+from .profile import CappedOrderedSet
+from .retrieval import QUERY_EXPANSION_MAP
+
+GROUP_STATE_FILE = "group_memory.json"
+GROUP_KEY_PREFIX = "group:"
+DEFAULT_RECENT_TURNS = 8
+DEFAULT_TOPIC_CAP = 8
+DEFAULT_MAX_GROUPS = 1024
+SUMMARY_FACTS = 5
+FLUSH_INTERVAL = 30
+
+
+def group_key(group_id):
+    """群组在向量库 / 统计中使用的 user_id"""
+    return f"{GROUP_KEY_PREFIX}{group_id}"
+
+
+# 查询扩展词表中的关键词及其同义词
+TOPIC_VOCABULARY = tuple(dict.fromkeys(
+    [word for key, words in QUERY_EXPANSION_MAP.items() for word in [key, *words]]))
+# #话题#、《作品》、「引用」、【标签】
+_MARKED_TOPIC = re.compile(r"#([^#\s]{1,20})#?|[《「『【]([^》」』】]{1,20})[》」』】]")
+# 聊聊 / 说说 / 关于 …之后的词（遇到语气词或标点截止）
+_LEAD_TOPIC = re.compile(r"(?:聊聊|说说|谈谈|讨论一下|讨论|关于)([^\s，。！？、,.!?的吧呢吗啊了]{2,6})")
+_LATIN_WORD = re.compile(r"[A-Za-z][A-Za-z0-9+#\-]{2,}")
+
+
+def detect_topics(text, others=()):
+    """
+    从一条群聊发言中提取话题（按出现顺序去重）：
+    - 显式标记：#话题#、《作品》、「引用」等
+    - 引导语：聊聊 / 关于 / 讨论 之后的词
+    - 词表：查询扩展词表中的关键词及其同义词
+    - 复现词：在其他成员最近发言（others）中也出现过的英文词，例如游戏名、项目名
+    """
+    text = text or ""
+    topics = []
+    for match in _MARKED_TOPIC.finditer(text):
+        topics.append(match.group(1) or match.group(2))
+    topics.extend(_LEAD_TOPIC.findall(text))
+    lowered = text.lower()
+    topics.extend(word for word in TOPIC_VOCABULARY if word.lower() in lowered)
+    if others:
+        seen = {word.lower() for other in others for word in _LATIN_WORD.findall(other)}
+        topics.extend(word for word in _LATIN_WORD.findall(text) if word.lower() in seen)
+    return list(dict.fromkeys(topic.strip() for topic in topics if topic.strip()))
+
+
+class _GroupState:
+    __slots__ = ("topics", "recent", "version", "summary", "summary_facts", "summary_version", "last_active")
+
+    def __init__(self, topics=(), recent=(), version=0, topic_cap=DEFAULT_TOPIC_CAP,
+                 recent_turns=DEFAULT_RECENT_TURNS, last_active=0.0):
+        self.topics = CappedOrderedSet(topics, topic_cap)
+        self.recent = deque(recent, maxlen=recent_turns)
+        self.version = version
+        self.summary = None
+        self.summary_facts = []
+        self.summary_version = -1
+        self.last_active = last_active
+
+    def to_dict(self):
+        return {
+            "topics": self.topics.to_list(),
+            "recent": list(self.recent),
+            "version": self.version,
+            "last_active": self.last_active,
+        }
+
+
+class GroupMemory:
+    def __init__(self, memory, recent_turns=DEFAULT_RECENT_TURNS, topic_cap=DEFAULT_TOPIC_CAP,
+                 max_groups=DEFAULT_MAX_GROUPS):
+        self.memory = memory
+        self.recent_turns = max(1, int(recent_turns))
+        self.topic_cap = max(1, int(topic_cap))
+        self.max_groups = max(1, int(max_groups))
+        self.path = os.path.join(memory.data_dir, GROUP_STATE_FILE)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_flush = time.time()
+
+        self.groups = OrderedDict()
+        stored = memory._load_json(self.path)
+        for group_id, data in sorted(stored.items(), key=lambda item: item[1].get("last_active", 0)):
+            self.groups[group_id] = _GroupState(
+                topics=data.get("topics", []),
+                recent=[tuple(turn) for turn in data.get("recent", [])],
+                version=data.get("version", 0),
+                topic_cap=self.topic_cap,
+                recent_turns=self.recent_turns,
+                last_active=data.get("last_active", 0.0)
+            )
+
+    def _state(self, group_id):
+        """取群状态（不存在时创建），超过上限时淘汰最久未活跃的群"""
+        state = self.groups.get(group_id)
+        if state is None:
+            state = _GroupState(topic_cap=self.topic_cap, recent_turns=self.recent_turns)
+            self.groups[group_id] = state
+            while len(self.groups) > self.max_groups:
+                self.groups.popitem(last=False)
+        return state
+
+    def _activate(self, group_id, state, ts):
+        state.last_active = ts
+        self.groups.move_to_end(group_id)
+        self._dirty = True
+
+    # === 写入 ===
+
+    def record_turn(self, group_id, speaker, text, ts=None):
+        """记录一条群聊发言，并更新正在进行的话题"""
+        if not text:
+            return
+        ts = ts or time.time()
+        group_id = str(group_id)
+        with self._lock:
+            state = self._state(group_id)
+            speaker = str(speaker or "")
+            topics = detect_topics(text, [content for _, who, content in state.recent if who != speaker])
+            state.recent.append((ts, speaker, text))
+            if topics and topics != state.topics.recent(len(topics)):
+                state.topics.extend(topics)
+                state.version += 1
+            self._activate(group_id, state, ts)
+        self._maybe_flush()
+
+    def update_topics(self, group_id, topics):
+        group_id = str(group_id)
+        with self._lock:
+            state = self._state(group_id)
+            state.topics.extend(topics)
+            state.version += 1
+            self._activate(group_id, state, time.time())
+        self._maybe_flush()
+
+    def add_fact(self, group_id, content):
+        """写入一条群事实（进入向量库，可被成员的查询检索到）"""
+        group_id = str(group_id)
+        self.memory.add_log(group_key(group_id), content, type="insight")
+        self.bump(group_id)
+
+    def bump(self, group_id):
+        """事实被增删后调用，使群摘要失效"""
+        with self._lock:
+            state = self._state(str(group_id))
+            state.version += 1
+            self._dirty = True
+
+    # === 读取 ===
+
+    def summary(self, group_id):
+        """返回 (摘要文本, 版本, 摘要中的事实)；版本未变时直接复用缓存"""
+        group_id = str(group_id)
+        with self._lock:
+            state = self.groups.get(group_id)
+            if state is None:
+                return "", 0, []
+            if state.summary_version == state.version:
+                metrics.incr("group.summary_reuse")
+                return state.summary, state.version, state.summary_facts
+            version = state.version
+            topics = state.topics.to_list()
+
+        # 旧版本可能把群事实归档了，先回迁再读统计，避免缓存一份缺少事实的摘要
+        self.memory._ensure_hot(group_key(group_id))
+        parts = []
+        if topics:
+            parts.append("当前话题: " + ", ".join(reversed(topics)))
+        facts = [content for _, doc_type, content in
+                 self.memory.stats.get(group_key(group_id)).get("recent", []) if doc_type == "insight"]
+        # 同一事实可能被多次写入，摘要里只列一次
+        facts = list(dict.fromkeys(facts))[:SUMMARY_FACTS]
+        if facts:
+            parts.append("群内共识:\n" + "\n".join(f"- {fact}" for fact in facts))
+        text = "\n".join(parts)
+
+        # 空摘要不缓存：成本很低，且事实稍后写入时不必依赖版本号变化
+        with self._lock:
+            if text and state.version == version:
+                state.summary = text
+                state.summary_facts = facts
+                state.summary_version = version
+        metrics.incr("group.summary_build")
+        return text, version, facts
+
+    def recent_entries(self, group_id, limit=None):
+        """最近的群聊发言（按时间倒序）：[{"ts", "speaker", "content"}]"""
+        with self._lock:
+            state = self.groups.get(str(group_id))
+            turns = list(state.recent) if state is not None else []
+        turns.reverse()
+        if limit is not None:
+            turns = turns[:limit]
+        return [{"ts": ts, "speaker": speaker, "content": content} for ts, speaker, content in turns]
+
+    # === 持久化 ===
+
+    def _maybe_flush(self):
+        if time.time() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = {group_id: state.to_dict() for group_id, state in self.groups.items()}
+            self._dirty = False
+            self._last_flush = time.time()
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except Exception as e:
+            logger.error(f"[Sakiko Group] Failed to save group memory: {e}")
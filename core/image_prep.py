@@ -0,0 +1,127 @@
+# plugins/astrbot_plugin_ai_personality/core/image_prep.py
+# -*- coding: utf-8 -*-
+"""
+Image preprocessing between download and MCP understand_image.
+
+- 限制最长边分辨率
+- 动图只取第一帧
+- 重新编码为紧凑的 JPEG / WebP
+- 对处理后的像素计算内容指纹，同一用户再次发送同一张图（转发、重复表情等）时复用描述。
+  只做精确匹配且按用户隔离：感知哈希分不清版式相同、文字不同的截图，会把别人图片的描述错配过来
+
+输入为本地路径或二进制文件对象，输出为内存中的字节，由调用方决定是否落盘。
+未安装 Pillow 时原样透传，仅跳过去重。
+"""
+import io
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+from .log import logger
+from .metrics import metrics
+
+DEFAULT_MAX_SIDE = 1280
+DEFAULT_QUALITY = 80
+DEFAULT_CACHE_SIZE = 256
+
+
+class PreparedImage:
+    __slots__ = ("data", "ext", "fingerprint", "original_bytes", "prepared_bytes", "elapsed_ms")
+
+    def __init__(self, data, ext, fingerprint=None, original_bytes=0, prepared_bytes=0, elapsed_ms=0.0):
+        self.data = data
+        self.ext = ext
+        self.fingerprint = fingerprint
+        self.original_bytes = original_bytes
+        self.prepared_bytes = prepared_bytes
+        self.elapsed_ms = elapsed_ms
+
+
+def fingerprint(image):
+    """处理后单帧的内容指纹：尺寸 + 像素摘要，只有像素完全相同才相等"""
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16).hexdigest()
+    return f"{image.size[0]}x{image.size[1]}:{digest}"
+
+
+class ImagePreprocessor:
+    def __init__(self, max_side=DEFAULT_MAX_SIDE, fmt="JPEG", quality=DEFAULT_QUALITY,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        self.max_side = max_side
+        self.fmt = fmt.upper()
+        self.quality = quality
+        self.cache_size = cache_size
+        # (scope, fingerprint) -> 图像描述
+        self._descriptions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return PILImage is not None
+
+    def prepare(self, image) -> PreparedImage:
+        """把原图处理为压缩后的单帧图片字节；失败时返回原图字节"""
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, "rb") as f:
+                original = f.read()
+        else:
+            image.seek(0)
+            original = image.read()
+        original_bytes = len(original)
+        if not self.enabled:
+            return PreparedImage(original, ".jpg", original_bytes=original_bytes, prepared_bytes=original_bytes)
+
+        start = time.perf_counter()
+        try:
+            with PILImage.open(io.BytesIO(original)) as img:
+                source_ext = f".{(img.format or 'jpeg').lower()}"
+                animated = getattr(img, "n_frames", 1) > 1
+                img.seek(0)  # 动图取第一帧
+                frame = img.convert("RGB")
+            fits = max(frame.size) <= self.max_side
+            frame.thumbnail((self.max_side, self.max_side))
+            digest = fingerprint(frame)
+
+            buf = io.BytesIO()
+            frame.save(buf, self.fmt, quality=self.quality)
+            data, ext = buf.getvalue(), (".webp" if self.fmt == "WEBP" else ".jpg")
+
+            # 原图本就是尺寸合规的单帧小图、压缩后反而更大时保留原图
+            if len(data) >= original_bytes and fits and not animated:
+                data, ext = original, source_ext
+        except Exception as e:
+            logger.warning(f"[Sakiko Image] Preprocess failed, using original: {e}")
+            return PreparedImage(original, ".jpg", original_bytes=original_bytes, prepared_bytes=original_bytes)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        prepared_bytes = len(data)
+        metrics.observe("image.prep_ms", elapsed_ms)
+        metrics.observe("image.bytes_saved", original_bytes - prepared_bytes)
+        metrics.incr("image.bytes_saved_total", original_bytes - prepared_bytes)
+        return PreparedImage(data, ext, digest, original_bytes, prepared_bytes, elapsed_ms)
+
+    def lookup(self, scope, fingerprint):
+        """查找同一 scope（用户）下内容完全相同的图片的描述"""
+        if fingerprint is None:
+            return None
+        key = (str(scope), fingerprint)
+        with self._lock:
+            description = self._descriptions.get(key)
+            if description is not None:
+                self._descriptions.move_to_end(key)
+        metrics.incr("image.reuse_hit" if description is not None else "image.reuse_miss")
+        return description
+
+    def remember(self, scope, fingerprint, description):
+        if fingerprint is None or not description:
+            return
+        with self._lock:
+            self._descriptions[(str(scope), fingerprint)] = description
+            while len(self._descriptions) > self.cache_size:
+                self._descriptions.popitem(last=False)
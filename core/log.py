@@ -0,0 +1,14 @@
+# plugins/astrbot_plugin_ai_personality/core/log.py
+# -*- coding: utf-8 -*-
+"""
+Logger shared by the core modules.
+
+插件内使用 AstrBot 的 logger；记忆服务、维护工具与评测脚本可以在没有安装 AstrBot 的环境
+（例如 CI）中独立运行，此时退回标准库 logging。
+"""
+try:
+    from astrbot.api import logger
+except ImportError:
+    import logging
+
+    logger = logging.getLogger("sakiko")
@@ -0,0 +1,339 @@
+# plugins/astrbot_plugin_ai_personality/core/maintenance.py
+# -*- coding: utf-8 -*-
+"""
+soulmate_memory 的维护工具：导出、导入、压缩。
+
+所有操作都按页流式处理，内存占用与集合大小无关。
+压缩会写入一个临时副本后再替换原数据，要求使用同一数据目录的 bot / 记忆服务已停止
+（通过数据目录锁检查）。向量模型固定取自插件配置的 embedding_model，与运行时保持一致。
+
+    python -m astrbot_plugin_ai_personality.core.maintenance export --out memory.jsonl --embeddings
+    python -m astrbot_plugin_ai_personality.core.maintenance import --in memory.jsonl --checkpoint import.ckpt
+    python -m astrbot_plugin_ai_personality.core.maintenance compact --drop-orphans --reembed
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+
+from .backends import create_backend, lock_data_dir, BACKEND_CHROMA, BACKEND_NUMPY
+from .embeddings import create_embedding_function, configured_model
+from .group_memory import GROUP_KEY_PREFIX
+
+DEFAULT_DATA_DIR = "/AstrBot/data/soulmate_data"
+DEFAULT_PAGE_SIZE = 256
+STAGING_SUFFIX = "__compact"
+RETIRED_SUFFIX = "__retired"
+
+
+class MaintenanceError(RuntimeError):
+    pass
+
+
+class Progress:
+    """吞吐与内存占用报告"""
+
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.start = time.perf_counter()
+
+    def advance(self, n):
+        self.count += n
+        elapsed = max(time.perf_counter() - self.start, 1e-6)
+        print(f"[{self.label}] {self.count} records, {self.count / elapsed:.0f} rec/s, "
+              f"rss={_rss_mb():.1f}MB peak={_peak_rss_mb():.1f}MB", file=sys.stderr)
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-6)
+        return (f"{self.label}: {self.count} records in {elapsed:.1f}s "
+                f"({self.count / elapsed:.0f} rec/s), peak RSS {_peak_rss_mb():.1f}MB")
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except Exception:
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def resolve_model(requested=None):
+    """
+    返回运行时使用的向量模型；显式指定了不同的模型时拒绝执行，
+    否则写入的向量与运行时查询不在同一空间，检索会静默失效
+    """
+    runtime = configured_model()
+    if requested is not None and requested != runtime:
+        raise MaintenanceError(
+            f"--model {requested!r} differs from the runtime embedding_model {runtime or '(chroma default)'!r}; "
+            f"set embedding_model in config.json first, then rerun"
+        )
+    return runtime
+
+
+def exclusive_lock(data_dir):
+    """确认 bot / 记忆服务已停止，并在维护期间阻止它们启动"""
+    try:
+        return lock_data_dir(data_dir, exclusive=True)
+    except BlockingIOError:
+        raise MaintenanceError(f"{data_dir} is in use; stop the bot and the memory service before running maintenance")
+
+
+def iter_pages(backend, page_size=DEFAULT_PAGE_SIZE, embeddings=False):
+    """逐页遍历整个存储"""
+    include = ("documents", "metadatas", "embeddings") if embeddings else ("documents", "metadatas")
+    offset = 0
+    while True:
+        page = backend.get(limit=page_size, offset=offset, include=include)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def _to_list(vec):
+    return vec.tolist() if hasattr(vec, "tolist") else list(vec)
+
+
+# ============================================================
+# Export / Import
+# ============================================================
+
+def export_jsonl(backend, out_path, page_size=DEFAULT_PAGE_SIZE, embeddings=False):
+    progress = Progress("export")
+    with open(out_path, "w", encoding="utf-8") as f:
+        for page in iter_pages(backend, page_size, embeddings):
+            for i, mem_id in enumerate(page["ids"]):
+                record = {"id": mem_id, "document": page["documents"][i], "metadata": page["metadatas"][i]}
+                if embeddings:
+                    record["embedding"] = _to_list(page["embeddings"][i])
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            progress.advance(len(page["ids"]))
+    return progress
+
+
+def _read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        return int(json.load(f).get("lines_done", 0))
+
+
+def _write_checkpoint(path, lines_done):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"lines_done": lines_done}, f)
+    os.replace(tmp, path)
+
+
+def import_jsonl(backend, in_path, batch_size=DEFAULT_PAGE_SIZE, checkpoint=None, embed_fn=None, reembed=False):
+    """
+    按批导入 JSONL；每批写入成功后更新 checkpoint，中断后重跑会从断点继续。
+    记录没有 embedding 或指定 reembed 时用 embed_fn 重新计算。
+    """
+    progress = Progress("import")
+    done = _read_checkpoint(checkpoint)
+    batch = []
+    embedder = [embed_fn]
+
+    def flush(lines_done):
+        if not batch:
+            return
+        # 断点续传时最后一批可能已部分写入，已存在的 id 跳过，保证重跑幂等
+        existing = set(backend.get(ids=[r["id"] for r in batch], include=())["ids"])
+        if existing:
+            batch[:] = [r for r in batch if r["id"] not in existing]
+            if not batch:
+                _write_checkpoint(checkpoint, lines_done)
+                return
+        needs = [i for i, r in enumerate(batch) if reembed or "embedding" not in r]
+        if needs:
+            if embedder[0] is None:
+                embedder[0] = create_embedding_function(resolve_model())
+            vectors = embedder[0]([batch[i]["document"] for i in needs])
+            for i, vec in zip(needs, vectors):
+                batch[i]["embedding"] = vec
+        backend.add(
+            ids=[r["id"] for r in batch],
+            documents=[r["document"] for r in batch],
+            metadatas=[r["metadata"] for r in batch],
+            embeddings=[_to_list(r["embedding"]) for r in batch]
+        )
+        _write_checkpoint(checkpoint, lines_done)
+        progress.advance(len(batch))
+        batch.clear()
+
+    with open(in_path, "r", encoding="utf-8") as f:
+        line_no = 0
+        for line_no, line in enumerate(f, start=1):
+            if line_no <= done or not line.strip():
+                continue
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                flush(line_no)
+        flush(line_no)
+    return progress
+
+
+# ============================================================
+# Compaction
+# ============================================================
+
+def _known_users(data_dir):
+    users = set()
+    for name in ("dynamic_profiles.json", "user_states.json"):
+        path = os.path.join(data_dir, name)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                users.update(json.load(f).keys())
+    return users
+
+
+def _is_known(user_id, known):
+    """群事实（group:<id>）没有 profile / state，始终保留"""
+    return user_id in known or user_id.startswith(GROUP_KEY_PREFIX)
+
+
+def _open_staging(kind, data_dir, quantization):
+    if kind == BACKEND_CHROMA:
+        from .backends.chroma_backend import ChromaBackend, COLLECTION_NAME
+        staging = ChromaBackend(data_dir, collection_name=COLLECTION_NAME + STAGING_SUFFIX)
+        try: staging.chroma.delete_collection(staging.collection_name)
+        except Exception: pass
+        return staging
+    from .backends.numpy_backend import NumpyBackend
+    staging = NumpyBackend(data_dir, quantization=quantization, store_name="numpy_store" + STAGING_SUFFIX)
+    shutil.rmtree(staging.root, ignore_errors=True)
+    os.makedirs(staging.root, exist_ok=True)
+    return staging
+
+
+def _swap_staging(kind, live, staging):
+    """用压缩后的副本替换线上数据（同时重建索引）；旧数据先改名保留，替换成功后才删除"""
+    if kind == BACKEND_CHROMA:
+        retired = live.collection_name + RETIRED_SUFFIX
+        try: live.chroma.delete_collection(retired)
+        except Exception: pass
+        live.chroma.get_collection(live.collection_name).modify(name=retired)
+        try:
+            staging.chroma.get_collection(staging.collection_name).modify(name=live.collection_name)
+        except Exception:
+            live.chroma.get_collection(retired).modify(name=live.collection_name)
+            raise
+        live.chroma.delete_collection(retired)
+        return
+    retired = live.root + ".old"
+    shutil.rmtree(retired, ignore_errors=True)
+    os.replace(live.root, retired)
+    os.replace(staging.root, live.root)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def compact(kind, data_dir, quantization="float16", page_size=DEFAULT_PAGE_SIZE,
+            drop_orphans=False, reembed=False, model_name=None):
+    """
+    把存储流式复制到新副本后替换：
+    - drop_orphans: 丢弃 profile / state 中都不存在的用户
+    - reembed: 用配置的 embedding_model 重新计算向量（切换模型后使用）
+    重写副本本身即重建索引（Chroma 的 HNSW / NumPy 的连续数组）
+    """
+    embed_fn = create_embedding_function(resolve_model(model_name)) if reembed else None
+    lock = exclusive_lock(data_dir)
+    try:
+        return _compact(kind, data_dir, quantization, page_size, drop_orphans, embed_fn)
+    finally:
+        if lock is not None:
+            lock.close()
+
+
+def _compact(kind, data_dir, quantization, page_size, drop_orphans, embed_fn):
+    reembed = embed_fn is not None
+    live = create_backend(kind, data_dir, quantization=quantization)
+    staging = _open_staging(kind, data_dir, quantization)
+    known = _known_users(data_dir) if drop_orphans else None
+
+    progress = Progress("compact")
+    dropped = 0
+    for page in iter_pages(live, page_size, embeddings=not reembed):
+        keep = [i for i, meta in enumerate(page["metadatas"])
+                if known is None or _is_known(str(meta.get("user_id", "")), known)]
+        dropped += len(page["ids"]) - len(keep)
+        if not keep:
+            continue
+        documents = [page["documents"][i] for i in keep]
+        embeddings = embed_fn(documents) if reembed else [page["embeddings"][i] for i in keep]
+        staging.add(
+            ids=[page["ids"][i] for i in keep],
+            documents=documents,
+            metadatas=[page["metadatas"][i] for i in keep],
+            embeddings=[_to_list(v) for v in embeddings]
+        )
+        progress.advance(len(keep))
+
+    _swap_staging(kind, live, staging)
+    print(f"Dropped {dropped} orphaned records", file=sys.stderr)
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="soulmate_memory maintenance")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--backend", choices=[BACKEND_CHROMA, BACKEND_NUMPY], default=BACKEND_CHROMA)
+    parser.add_argument("--quantization", choices=["float16", "int8"], default="float16")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="stream the store to JSONL")
+    p_export.add_argument("--out", required=True)
+    p_export.add_argument("--embeddings", action="store_true", help="include embedding vectors")
+
+    p_import = sub.add_parser("import", help="batched, resumable import from JSONL")
+    p_import.add_argument("--in", dest="in_path", required=True)
+    p_import.add_argument("--checkpoint", default=None)
+    p_import.add_argument("--reembed", action="store_true")
+    p_import.add_argument("--model", default=None, help="must match embedding_model in config.json")
+
+    p_compact = sub.add_parser("compact", help="rewrite the store, optionally dropping orphans / re-embedding")
+    p_compact.add_argument("--drop-orphans", action="store_true")
+    p_compact.add_argument("--reembed", action="store_true")
+    p_compact.add_argument("--model", default=None, help="must match embedding_model in config.json")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            backend = create_backend(args.backend, args.data_dir, quantization=args.quantization)
+            progress = export_jsonl(backend, args.out, args.page_size, args.embeddings)
+        elif args.command == "import":
+            resolve_model(args.model)
+            # 运行中的 bot 缓存着分区副本，下一次写入会覆盖导入的记录，因此同样需要独占锁
+            lock = exclusive_lock(args.data_dir)
+            try:
+                backend = create_backend(args.backend, args.data_dir, quantization=args.quantization)
+                progress = import_jsonl(backend, args.in_path, args.page_size, args.checkpoint,
+                                        reembed=args.reembed)
+            finally:
+                if lock is not None:
+                    lock.close()
+        else:
+            progress = compact(args.backend, args.data_dir, args.quantization, args.page_size,
+                               args.drop_orphans, args.reembed, args.model)
+    except MaintenanceError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(2)
+    print(progress.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -13,12 +13,27 @@ import os
 import json
 import time
 import uuid
-import chromadb
-from astrbot.api import logger
+import threading
+from .log import logger
+from .retrieval import RetrievalBatcher, DEFAULT_MAX_BATCH, DEFAULT_MAX_WAIT_MS, enhance_query
+from .backends import create_backend, lock_data_dir, BACKEND_CHROMA
+from .tiering import TieringManager
+from .profile import UserProfile, DEFAULT_LIST_CAP
+from .stats import MemoryStats
+from .warmup import WarmupManager
+from .embeddings import create_embedding_function
+from .group_memory import GroupMemory, group_key, GROUP_KEY_PREFIX, DEFAULT_RECENT_TURNS
+
+DEFAULT_DATA_DIR = "/AstrBot/data/soulmate_data"
+
 
 class MemoryManager:
-    def __init__(self, plugin_dir):
-        self.data_dir = "/AstrBot/data/soulmate_data"
+    def __init__(self, plugin_dir, batch_max_size=DEFAULT_MAX_BATCH, batch_max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 backend=BACKEND_CHROMA, quantization="float16", tiering_idle_days=0,
+                 profile_list_cap=DEFAULT_LIST_CAP, warmup_cache_users=256, warmup_ttl_seconds=300,
+                 group_recent_turns=DEFAULT_RECENT_TURNS, embedding_model="", data_dir=DEFAULT_DATA_DIR,
+                 embed_fn=None):
+        self.data_dir = data_dir
 
         if not os.path.exists(self.data_dir):
             try:
@@ -29,19 +44,48 @@ class MemoryManager:
 
         self.profile_path = os.path.join(self.data_dir, "dynamic_profiles.json")
         self.state_path = os.path.join(self.data_dir, "user_states.json")
-        self.chroma_path = os.path.join(self.data_dir, "chromadb")
 
-        logger.info(f"[Sakiko Memory] ChromaDB Path: {self.chroma_path}")
+        # 持有数据目录共享锁，离线压缩工具据此判断 bot / 记忆服务是否仍在运行
         try:
-            self.chroma = chromadb.PersistentClient(path=self.chroma_path)
-        except Exception as e:
-            logger.error(f"[Sakiko Memory] DB Init Failed: {e}")
-            if "readonly" in str(e):
-                logger.error("!!! 请在宿主机执行: sudo chmod -R 777 ./data/soulmate_data !!!")
-            raise e
+            self._data_lock = lock_data_dir(self.data_dir)
+        except BlockingIOError:
+            raise RuntimeError(f"{self.data_dir} is locked by a running maintenance job (compact)")
+
+        # 向量存储后端：chroma（默认）或 numpy
+        self.store = create_backend(backend, self.data_dir, quantization=quantization)
 
-        self.profiles = self._load_json(self.profile_path)
+        # profile 在内存中只以 UserProfile 形式存在，落盘时序列化为紧凑格式
+        self.profile_list_cap = profile_list_cap
+        self.profiles = {user_id: UserProfile.from_stored(stored, profile_list_cap)
+                         for user_id, stored in self._load_json(self.profile_path).items()}
         self.states = self._load_json(self.state_path)
+        # profiles / states 的修改与落盘、归档与回迁都在此锁内进行
+        self._state_lock = threading.RLock()
+
+        # 物化的每用户记忆统计（增量维护，后台对账）
+        self.stats = MemoryStats(self.data_dir)
+
+        # 群组层：群事实 / 话题 / 近期群聊，摘要按版本缓存
+        self.groups = GroupMemory(self, recent_turns=group_recent_turns)
+
+        # 冷热分层：闲置用户归档，再次出现时回迁
+        self.tiering = TieringManager(self, idle_days=tiering_idle_days)
+
+        # 显式持有 embedding 函数（由 embedding_model 配置，与维护工具一致），所有后端共用同一套向量；
+        # 评测等场景可直接注入 embed_fn
+        self.embedding_model = embedding_model
+        self.embed_fn = embed_fn or create_embedding_function(embedding_model)
+        self.batcher = None
+        if batch_max_size > 1:
+            self.batcher = RetrievalBatcher(
+                embed_fn=self.embed_fn,
+                query_fn=self.store.query,
+                max_batch=batch_max_size,
+                max_wait_ms=batch_max_wait_ms
+            )
+
+        # 预热：记录活跃度，后台预取最近对话 / profile / insight 向量页
+        self.warmup = WarmupManager(self, max_users=warmup_cache_users, ttl_seconds=warmup_ttl_seconds)
 
     def _load_json(self, path):
         if not os.path.exists(path): return {}
@@ -50,10 +94,13 @@ class MemoryManager:
                 return json.load(f)
         except: return {}
 
-    def _save_json(self, path, data):
+    def _save_json(self, path, data, compact=False):
         try:
             with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+                if compact:
+                    json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+                else:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
             try: os.chmod(path, 0o666)
             except: pass
         except Exception as e:
@@ -63,82 +110,48 @@ class MemoryManager:
     # Layer 3: Dynamic Profile (人格配置)
     # ============================================================
 
+    def _profile(self, user_id):
+        """返回用户的 UserProfile；尚无记录时返回一个不登记的默认 profile"""
+        profile = self.profiles.get(user_id)
+        return profile if profile is not None else UserProfile(self.profile_list_cap)
+
+    def _save_profiles(self):
+        self._save_json(self.profile_path,
+                        {user_id: profile.to_compact() for user_id, profile in self.profiles.items()},
+                        compact=True)
+
     def get_user_profile(self, user_id):
         """
         获取用户的人格配置，包含交互模式、偏好、敏感话题等
         """
         user_id = str(user_id)
-        default_profile = {
-            "communication_style": "balanced",
-            "humor_level": "moderate",
-            "caring_frequency": "moderate",
-            "sensitive_topics": [],
-            "preferred_topics": [],
-            "interaction_patterns": [],
-            "personality_traits": [],
-            "last_context": "",
-            "relationship_summary": "",
-            "total_conversations": 0,
-            "last_interaction_time": 0
-        }
-
-        stored = self.profiles.get(user_id)
-        if stored is None:
-            return default_profile
-
-        # 兼容旧数据：如果存储的是字符串，迁移到新的字典格式
-        if isinstance(stored, str):
-            if stored and stored != "普通用户":
-                default_profile["relationship_summary"] = stored
-            return default_profile
-
-        # 确保返回字典（防御性检查）
-        if not isinstance(stored, dict):
-            return default_profile
-
-        return {**default_profile, **stored}
+        self._ensure_hot(user_id)
+        return self._profile(user_id).to_dict()
 
     def update_user_profile(self, user_id, profile_updates):
         """
         增量更新用户人格配置
         """
         user_id = str(user_id)
-        current = self.get_user_profile(user_id)
-
-        # 直接覆盖更新
-        for key, value in profile_updates.items():
-            if key in current:
-                if isinstance(current[key], list) and isinstance(value, list):
-                    # 列表类型去重合并
-                    current[key] = list(set(current[key] + value))
-                else:
-                    current[key] = value
-
-        current["last_interaction_time"] = time.time()
-        self.profiles[user_id] = current
-        self._save_json(self.profile_path, self.profiles)
+        self._ensure_hot(user_id)
+        with self._state_lock:
+            profile = self.profiles.get(user_id)
+            if profile is None:
+                profile = self.profiles[user_id] = UserProfile(self.profile_list_cap)
+
+            # 列表字段按最近出现排序去重（有上限），其余字段直接覆盖
+            profile.merge(profile_updates)
+            profile.touch(time.time())
+            self._save_profiles()
         logger.info(f"[Profile Updated] User {user_id}: {list(profile_updates.keys())}")
 
     def get_profile_summary(self, user_id):
         """
-        获取人格配置的简洁摘要，用于 prompt 注入
+        获取人格配置的简洁摘要，用于 prompt 注入（profile 未变化时复用缓存）
         """
-        profile = self.get_user_profile(user_id)
-
-        parts = []
-        if profile.get("relationship_summary"):
-            parts.append(f"【关系定位】{profile['relationship_summary']}")
-        if profile.get("personality_traits"):
-            traits = ", ".join(profile["personality_traits"][-5:])  # 只取最近5个
-            parts.append(f"【用户性格】{traits}")
-        if profile.get("communication_style") != "balanced":
-            parts.append(f"【沟通风格】{profile['communication_style']}")
-        if profile.get("humor_level") != "moderate":
-            parts.append(f"【幽默程度】{profile['humor_level']}")
-        if profile.get("sensitive_topics"):
-            parts.append(f"【敏感话题】{', '.join(profile['sensitive_topics'])}")
-
-        return "\n".join(parts) if parts else "（用户资料正在学习中...）"
+        user_id = str(user_id)
+        self._ensure_hot(user_id)
+        return self._profile(user_id).summary()
 
     # ============================================================
     # Layer 2: Insights (长期记忆)
@@ -148,76 +161,97 @@ class MemoryManager:
         """
         获取待整理的长期记忆
         """
-        coll = self.chroma.get_or_create_collection("soulmate_memory")
-        res = coll.get(
+        res = self.store.get(
             where={"$and": [{"user_id": str(user_id)}, {"type": "insight"}]},
             include=["metadatas", "documents"],
             limit=limit
         )
         return {"ids": res['ids'], "documents": res['documents']}
 
-    def retrieve_insights(self, user_id, query_text, n_results=5):
+    def retrieve_insights(self, user_id, query_text, n_results=5, group_id=None):
         """
-        检索长期记忆
+        检索长期记忆；给出 group_id 时同时检索群事实，两者按相似度合并后仍只取 n_results 条
         """
-        coll = self.chroma.get_or_create_collection("soulmate_memory")
         try:
             if not query_text or not query_text.strip():
                 return []
 
-            results = coll.query(
-                query_texts=[query_text],
-                n_results=n_results,
-                where={"$and": [{"user_id": str(user_id)}, {"type": "insight"}]}
-            )
-            return results['documents'][0] if results['documents'] else []
+            keys = [str(user_id)]
+            if group_id:
+                gkey = group_key(group_id)
+                self._ensure_hot(gkey)
+                keys.append(gkey)
+
+            if self.batcher is not None:
+                results = self.batcher.submit_many([(key, query_text, n_results, "insight") for key in keys])
+            else:
+                embedding = self.embed_fn([query_text])
+                results = []
+                for key in keys:
+                    res = self.store.query(
+                        query_embeddings=embedding,
+                        n_results=n_results,
+                        where={"$and": [{"user_id": key}, {"type": "insight"}]}
+                    )
+                    docs = res['documents'][0] if res['documents'] else []
+                    dists = res['distances'][0] if res.get('distances') else [0.0] * len(docs)
+                    results.append(list(zip(docs, dists)))
+
+            if len(results) == 1:
+                return [doc for doc, _ in results[0]]
+            return merge_scored(results, n_results)
         except Exception as e:
             logger.error(f"[Memory Retrieve Insights Error] {e}")
             return []
 
     def delete_insights(self, ids):
         """删除指定的 insight"""
-        if not ids: return
-        coll = self.chroma.get_or_create_collection("soulmate_memory")
-        coll.delete(ids=ids)
+        self._delete_records(ids)
 
     # ============================================================
     # Layer 1: Raw Logs (短期对话)
     # ============================================================
 
-    def get_recent_raw_logs(self, user_id, limit=5):
-        """获取最近 N 条原始对话记录用于上下文连贯性"""
-        coll = self.chroma.get_or_create_collection("soulmate_memory")
+    def get_recent_raw_entries(self, user_id, limit=5):
+        """获取最近 N 条原始对话记录（结构化，按时间倒序），优先使用预取结果"""
+        recent = self.warmup.take_recent(str(user_id), limit)
+        if recent is not None:
+            return recent
+        return self._load_recent_raw_entries(user_id, limit)
+
+    def _load_recent_raw_entries(self, user_id, limit=5):
         try:
-            results = coll.get(
+            results = self.store.get(
                 where={"$and": [{"user_id": str(user_id)}, {"type": "raw"}]},
                 include=["metadatas", "documents"],
                 limit=limit + 5
             )
 
             if not results['ids']:
-                return ""
+                return []
 
             logs = []
             for i in range(len(results['ids'])):
                 meta = results['metadatas'][i]
                 doc = results['documents'][i]
                 timestamp = float(meta.get("timestamp", 0))
-                logs.append({"ts": timestamp, "content": doc})
+                logs.append({"id": results['ids'][i], "ts": timestamp, "content": doc})
 
             logs.sort(key=lambda x: x['ts'], reverse=True)
-            recent = logs[:limit]
-
-            return "\n".join([item['content'] for item in recent])
+            return logs[:limit]
         except Exception as e:
             logger.error(f"[Memory Get Recent Raw Error] {e}")
-            return ""
+            return []
+
+    def get_recent_raw_logs(self, user_id, limit=5):
+        """获取最近 N 条原始对话记录用于上下文连贯性"""
+        recent = self.get_recent_raw_entries(user_id, limit)
+        return "\n".join([item['content'] for item in recent])
 
     def get_recent_history(self, user_id, limit=5):
         """获取最近 N 条记忆用于 Status 展示（包含 raw + insight）"""
-        coll = self.chroma.get_or_create_collection("soulmate_memory")
         try:
-            results = coll.get(
+            results = self.store.get(
                 where={"user_id": str(user_id)},
                 include=["metadatas", "documents"]
             )
@@ -251,19 +285,48 @@ class MemoryManager:
     # Unified Retrieval (统一检索接口)
     # ============================================================
 
-    def retrieve_all(self, user_id, query_text, n_results=5):
+    def retrieve_all(self, user_id, query_text, n_results=5, group_id=None):
         """
-        统一检索：profile摘要 + 长期记忆 + 短期对话历史
+        统一检索：profile摘要 + 长期记忆 + 短期对话历史（+ 群组上下文）
         返回结构化数据供 agent 使用
         """
+        self.touch(user_id)
         profile_summary = self.get_profile_summary(user_id)
-        insights = self.retrieve_insights(user_id, query_text, n_results)
-        recent_raw = self.get_recent_raw_logs(user_id, limit=5)
+        insights = self.retrieve_insights(user_id, query_text, n_results, group_id=group_id)
+        recent_entries = self.get_recent_raw_entries(user_id, limit=5)
 
-        return {
+        memories = {
             "profile": profile_summary,
             "insights": insights,
-            "recent_raw": recent_raw
+            "recent_raw": "\n".join([item['content'] for item in recent_entries]),
+            "recent_entries": recent_entries
+        }
+        if group_id:
+            memories["group"] = self.get_group_context(group_id)
+        return memories
+
+    # ============================================================
+    # Group Memory (群组层)
+    # ============================================================
+
+    def record_group_turn(self, group_id, speaker, text):
+        """群内每条消息调用（不论是否 @ bot），维护近期群聊与话题"""
+        self.groups.record_turn(group_id, speaker, text)
+
+    def add_group_fact(self, group_id, content):
+        self.groups.add_fact(group_id, content)
+
+    def update_group_topics(self, group_id, topics):
+        self.groups.update_topics(group_id, topics)
+
+    def get_group_context(self, group_id):
+        """群摘要（按版本缓存，所有成员共用）+ 摘要中的事实 + 近期群聊"""
+        summary, version, facts = self.groups.summary(group_id)
+        return {
+            "summary": summary,
+            "version": version,
+            "facts": facts,
+            "recent_entries": self.groups.recent_entries(group_id)
         }
 
     # ============================================================
@@ -272,11 +335,17 @@ class MemoryManager:
 
     def get_state(self, user_id):
         user_id = str(user_id)
-        if user_id not in self.states:
-            self.states[user_id] = {"intimacy": 50, "mood": "calm", "raw_count": 0, "insight_count": 0}
-        return self.states[user_id]
+        self._ensure_hot(user_id)
+        with self._state_lock:
+            if user_id not in self.states:
+                self.states[user_id] = {"intimacy": 50, "mood": "calm", "raw_count": 0, "insight_count": 0}
+            return self.states[user_id]
 
     def update_state(self, user_id, updates):
+        with self._state_lock:
+            self._update_state(user_id, updates)
+
+    def _update_state(self, user_id, updates):
         s = self.get_state(user_id)
         if "intimacy" in updates:
             s['intimacy'] = max(0, min(100, s['intimacy'] + updates['intimacy']))
@@ -286,10 +355,95 @@ class MemoryManager:
             s['raw_count'] = max(0, s.get('raw_count', 0) + updates['raw_count_delta'])
         if "raw_count" in updates:
             s['raw_count'] = max(0, updates['raw_count'])
+        if "insight_count_delta" in updates:
+            s['insight_count'] = max(0, s.get('insight_count', 0) + updates['insight_count_delta'])
         if "insight_count" in updates:
             s['insight_count'] = max(0, updates['insight_count'])
         self._save_json(self.state_path, self.states)
 
+    def _sync_state_counts(self, user_id):
+        """以物化统计为准刷新 state 中的计数（整理触发条件依赖它；群组没有 state）"""
+        if str(user_id).startswith(GROUP_KEY_PREFIX):
+            return
+        self.update_state(user_id, {
+            "raw_count": self.stats.count(user_id, "raw"),
+            "insight_count": self.stats.count(user_id, "insight")
+        })
+
+    # ============================================================
+    # Materialized Statistics
+    # ============================================================
+
+    def get_memory_stats(self, user_id):
+        """O(1) 读取用户记忆统计：counts / bytes / oldest / newest / recent"""
+        user_id = str(user_id)
+        self._ensure_hot(user_id)
+        return self.stats.get(user_id)
+
+    def reconcile_stats(self):
+        """按实际存储对账统计，并同步所有用户 state 中的计数"""
+        drifted = self.stats.reconcile(self.store)
+        with self._state_lock:
+            for user_id in list(self.states):
+                s = self.states[user_id]
+                s['raw_count'] = self.stats.count(user_id, "raw")
+                s['insight_count'] = self.stats.count(user_id, "insight")
+            self._save_json(self.state_path, self.states)
+        return drifted
+
+    # ============================================================
+    # Tiering (冷热分层)
+    # ============================================================
+
+    def touch(self, user_id):
+        """记录活跃（冷热分层据此判断闲置、预热据此排序），归档用户同时回迁"""
+        self.tiering.touch(str(user_id))
+        self.warmup.record(str(user_id))
+
+    def _ensure_hot(self, user_id):
+        if user_id in self.tiering.archived:
+            self.tiering.rehydrate(user_id)
+
+    def run_tiering(self):
+        """归档闲置用户，返回当前工作集大小"""
+        self.tiering.run()
+        self.warmup.flush()
+        self.groups.flush()
+        return self.tiering.working_set()
+
+    # ============================================================
+    # Warm-up (预热)
+    # ============================================================
+
+    def prefetch(self, user_id):
+        """看到用户消息时调用：在后台预取其上下文（不阻塞，不计入活跃度）"""
+        return self.warmup.prefetch(user_id)
+
+    def warm_start(self, top_n=50):
+        """插件加载后调用：加载 embedding 模型并预取最活跃的用户"""
+        return self.warmup.warm_start(top_n)
+
+    def stop_warmup(self):
+        """取消未执行的预取并持久化活跃度"""
+        self.warmup.cancel()
+        self.warmup.flush()
+        self.tiering.flush()
+
+    def shutdown(self):
+        """插件卸载时调用：停止预热并持久化内存中的状态"""
+        self.stop_warmup()
+        self.groups.flush()
+        self.stats.flush()
+
+    def close(self):
+        """shutdown 之外再停止后台线程并释放数据目录锁（同一进程内反复创建实例时使用）"""
+        self.shutdown()
+        self.warmup.close()
+        if self.batcher is not None:
+            self.batcher.close()
+        if self._data_lock is not None:
+            self._data_lock.close()
+
     # ============================================================
     # Legacy Interface (向后兼容)
     # ============================================================
@@ -310,17 +464,17 @@ class MemoryManager:
 
     def add_log(self, user_id, content, type="raw"):
         """添加日志：raw 或 insight"""
-        coll = self.chroma.get_or_create_collection("soulmate_memory")
         try:
-            coll.add(
+            ts = time.time()
+            self.store.add(
+                ids=[str(uuid.uuid4())],
                 documents=[content],
-                metadatas=[{"type": type, "timestamp": str(time.time()), "user_id": str(user_id)}],
-                ids=[str(uuid.uuid4())]
+                metadatas=[{"type": type, "timestamp": str(ts), "user_id": str(user_id)}],
+                embeddings=self.embed_fn([content])
             )
-            if type == "raw":
-                self.update_state(user_id, {"raw_count_delta": 1})
-            elif type == "insight":
-                self.update_state(user_id, {"insight_count_delta": 1})
+            self.stats.on_add(user_id, type, content, ts)
+            self.warmup.invalidate(user_id)
+            self._sync_state_counts(user_id)
         except Exception as e:
             logger.error(f"[Memory Add Error] {e}")
 
@@ -329,31 +483,38 @@ class MemoryManager:
         return self.retrieve_insights(user_id, query_text, n_results)
 
     def get_raw_logs_for_consolidation(self, user_id):
-        coll = self.chroma.get_or_create_collection("soulmate_memory")
-        res = coll.get(where={"$and": [{"user_id": str(user_id)}, {"type": "raw"}]}, limit=15)
+        res = self.store.get(where={"$and": [{"user_id": str(user_id)}, {"type": "raw"}]}, limit=15)
         return {"ids": res['ids'], "documents": res['documents']}
 
     def delete_logs(self, ids):
+        self._delete_records(ids)
+
+    def _delete_records(self, ids):
+        """删除记录并同步统计与 state 计数"""
         if not ids: return
-        coll = self.chroma.get_or_create_collection("soulmate_memory")
-        coll.delete(ids=ids)
+        existing = self.store.get(ids=ids, include=["metadatas", "documents"])
+        self.store.delete(ids)
+        users = set()
+        for doc, meta in zip(existing['documents'], existing['metadatas']):
+            user_id = str(meta.get("user_id", ""))
+            self.stats.on_delete(user_id, meta.get("type", "unknown"), doc, float(meta.get("timestamp", 0)))
+            users.add(user_id)
+        for user_id in users:
+            self._sync_state_counts(user_id)
+            self.warmup.invalidate(user_id)
+            if user_id.startswith(GROUP_KEY_PREFIX):
+                self.groups.bump(user_id[len(GROUP_KEY_PREFIX):])
 
     def _enhance_query(self, query_text):
         """语义扩展查询"""
-        keyword_map = {
-            "累": ["工作", "疲劳", "忙", "困", "疲倦", "劳累"],
-            "忙": ["工作", "加班", "赶工", "紧急", "deadline"],
-            "懒": ["休息", "放松", "空闲", "摸鱼"],
-            "工作": ["上班", "任务", "项目", "demo", "急活"],
-            "疲劳": ["累", "困", "没精神", "疲惫"],
-            "抱怨": ["吐槽", "牢骚", "不满"],
-        }
+        return enhance_query(query_text)
 
-        enhanced = []
-        for word in keyword_map:
-            if word in query_text:
-                enhanced.extend(keyword_map[word])
 
-        if not enhanced:
-            return ""
-        return " ".join([query_text] + list(set(enhanced)))
+def merge_scored(result_lists, limit):
+    """按距离合并多路 [(文档, 距离)] 检索结果（越近越靠前），去重后截取 limit 条文档"""
+    best = {}
+    for results in result_lists:
+        for doc, distance in results:
+            if doc not in best or distance < best[doc]:
+                best[doc] = distance
+    return sorted(best, key=best.get)[:limit]
@@ -0,0 +1,388 @@
+# plugins/astrbot_plugin_ai_personality/core/memory_service.py
+# -*- coding: utf-8 -*-
+"""
+Shared Memory Service
+
+多个 AstrBot 实例共用同一个 soulmate_data 目录时，各自打开 PersistentClient 和 JSON
+状态文件会互相覆盖，并重复加载 embedding 模型。这里把 MemoryManager 放到一个独立进程里，
+通过 Unix domain socket 或 localhost TCP 暴露给各个 bot 进程：
+
+    python -m astrbot_plugin_ai_personality.core.memory_service --address unix:///AstrBot/data/soulmate_data/memory.sock
+
+协议：每帧 = 4 字节大端长度 + 1 字节编码标记 + payload
+- 编码标记 b"m" 为 msgpack，b"j" 为 JSON（未安装 msgpack 时的回退）
+- 请求  [req_id, method, args, kwargs]
+- 响应  [req_id, ok, result | error_message]
+同一连接上可以连续发送多个请求（pipelining），响应按 req_id 匹配。
+"""
+import os
+import json
+import queue
+import socket
+import struct
+import asyncio
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .log import logger
+
+HEADER = struct.Struct(">IB")
+CODEC_MSGPACK = ord("m")
+CODEC_JSON = ord("j")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+# 会修改 JSON 状态文件或向量库的方法，服务端串行执行。
+# 只读方法也可能触发归档用户回迁：回迁与 state / profile 写入由 MemoryManager 的状态锁互斥；
+# touch / prefetch 只更新内存中的活跃度或入队，不参与串行（每条消息都会调用）
+MUTATING_METHODS = {
+    "get_state", "update_state", "update_user_profile", "update_profile",
+    "add_log", "delete_insights", "delete_logs",
+    "record_group_turn", "add_group_fact", "update_group_topics",
+}
+
+# 客户端允许调用的方法（白名单）。生命周期与维护方法（shutdown / close / warm_start / run_tiering /
+# reconcile_stats 等）只能由服务进程自身调用，否则会影响共享同一服务的其他 bot
+CLIENT_METHODS = MUTATING_METHODS | {
+    "get_user_profile", "get_profile_summary", "get_profile",
+    "get_insights_for_consolidation", "get_raw_logs_for_consolidation",
+    "retrieve", "retrieve_insights", "retrieve_all",
+    "get_recent_raw_entries", "get_recent_raw_logs", "get_recent_history",
+    "get_group_context", "get_memory_stats", "touch", "prefetch",
+}
+
+
+class MemoryServiceError(RuntimeError):
+    """服务端调用失败或连接异常"""
+
+
+# ============================================================
+# Framing
+# ============================================================
+
+def _encode(obj):
+    if msgpack is not None:
+        return CODEC_MSGPACK, msgpack.packb(obj, use_bin_type=True)
+    return CODEC_JSON, json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def _decode(codec, payload):
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise MemoryServiceError("peer sent msgpack frame but msgpack is not installed")
+        return msgpack.unpackb(payload, raw=False)
+    return json.loads(payload.decode("utf-8"))
+
+
+def pack_frame(obj):
+    codec, payload = _encode(obj)
+    return HEADER.pack(len(payload), codec) + payload
+
+
+def parse_address(address):
+    """unix:///path/to.sock -> ("unix", path); tcp://127.0.0.1:8765 -> ("tcp", (host, port))"""
+    parsed = urlparse(address)
+    if parsed.scheme == "unix":
+        return "unix", parsed.path
+    if parsed.scheme == "tcp":
+        host = parsed.hostname or "127.0.0.1"
+        if host not in ("127.0.0.1", "localhost", "::1"):
+            raise ValueError(f"memory service must bind to localhost, got {host}")
+        return "tcp", (host, parsed.port or 8765)
+    raise ValueError(f"unsupported memory service address: {address}")
+
+
+# ============================================================
+# Server
+# ============================================================
+
+class MemoryServer:
+    def __init__(self, manager, address, workers=4):
+        self.manager = manager
+        self.kind, self.target = parse_address(address)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sakiko-memsvc")
+        self._write_lock = threading.Lock()
+        self._server = None
+
+    def _dispatch(self, method, args, kwargs):
+        if method not in CLIENT_METHODS:
+            raise MemoryServiceError(f"method not allowed: {method}")
+        fn = getattr(self.manager, method)
+        if method in MUTATING_METHODS:
+            with self._write_lock:
+                return fn(*args, **kwargs)
+        return fn(*args, **kwargs)
+
+    async def _handle_request(self, req, writer, send_lock):
+        loop = asyncio.get_running_loop()
+        req_id = req[0] if req else None
+        try:
+            _, method, args, kwargs = req
+            result = await loop.run_in_executor(self.executor, self._dispatch, method, args or [], kwargs or {})
+            frame = pack_frame([req_id, True, result])
+        except Exception as e:
+            frame = pack_frame([req_id, False, f"{type(e).__name__}: {e}"])
+        async with send_lock:
+            writer.write(frame)
+            await writer.drain()
+
+    async def _handle_conn(self, reader, writer):
+        send_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                length, codec = HEADER.unpack(header)
+                if length > MAX_FRAME_BYTES:
+                    raise MemoryServiceError(f"frame too large: {length}")
+                req = _decode(codec, await reader.readexactly(length))
+                task = asyncio.create_task(self._handle_request(req, writer, send_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            logger.warning(f"[Sakiko MemSvc] Connection error: {e}")
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+
+    async def run_periodic(self, method, interval, initial_delay=0):
+        """
+        服务进程自己的后台维护任务（冷热分层、统计对账）。
+
+        不持有 _write_lock：对账本身按无锁扫描设计，冷热分层只在逐个用户归档 / 回迁时持有
+        MemoryManager 的状态锁，整轮扫描期间客户端请求照常处理
+        """
+        if interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        fn = getattr(self.manager, method)
+        await asyncio.sleep(initial_delay)
+        while True:
+            try:
+                result = await loop.run_in_executor(self.executor, fn)
+                logger.info(f"[Sakiko MemSvc] {method}: {result}")
+            except Exception as e:
+                logger.error(f"[Sakiko MemSvc] {method} failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def serve_forever(self):
+        if self.kind == "unix":
+            if os.path.exists(self.target):
+                os.unlink(self.target)
+            self._server = await asyncio.start_unix_server(self._handle_conn, path=self.target)
+            try: os.chmod(self.target, 0o666)
+            except: pass
+        else:
+            host, port = self.target
+            self._server = await asyncio.start_server(self._handle_conn, host=host, port=port)
+        logger.info(f"[Sakiko MemSvc] Serving MemoryManager on {self.kind}:{self.target}")
+        async with self._server:
+            await self._server.serve_forever()
+
+
+# ============================================================
+# Client
+# ============================================================
+
+class MemoryClient:
+    """
+    MemoryManager 的远程代理：未显式定义的方法都会转发到服务端。
+
+    线程安全；连接池大小决定最多同时占用的 socket 数，pipeline() 在一个连接上批量发送请求。
+    """
+
+    def __init__(self, address, pool_size=4, timeout=10.0):
+        self.address = address
+        self.kind, self.target = parse_address(address)
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._ids = itertools.count(1)
+
+    def _connect(self):
+        if self.kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout)
+        sock.connect(self.target)
+        return sock
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+
+    def _release(self, sock, broken=False):
+        if broken:
+            try: sock.close()
+            except: pass
+        else:
+            self._pool.put_nowait(sock)
+        self._slots.release()
+
+    @staticmethod
+    def _recv_exact(sock, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if not chunk:
+                raise MemoryServiceError("connection closed by memory service")
+            buf.extend(chunk)
+        return bytes(buf)
+
+    def _roundtrip(self, sock, calls):
+        ids = [next(self._ids) for _ in calls]
+        sock.sendall(b"".join(
+            pack_frame([req_id, method, list(args), kwargs])
+            for req_id, (method, args, kwargs) in zip(ids, calls)
+        ))
+        responses = {}
+        while len(responses) < len(ids):
+            length, codec = HEADER.unpack(self._recv_exact(sock, HEADER.size))
+            req_id, ok, value = _decode(codec, self._recv_exact(sock, length))
+            responses[req_id] = (ok, value)
+        return [responses[req_id] for req_id in ids]
+
+    def pipeline(self, calls):
+        """
+        在同一连接上批量发送请求
+
+        Args:
+            calls: [(method, args, kwargs), ...]
+        Returns:
+            与 calls 顺序一致的结果列表；任一调用失败则抛出 MemoryServiceError
+        """
+        if not calls:
+            return []
+        # 非幂等调用不重试，避免请求已送达但连接断开时重复写入
+        attempts = 1 if any(method in MUTATING_METHODS for method, _, _ in calls) else 2
+        for attempt in range(attempts):
+            sock = None
+            try:
+                sock = self._acquire()
+                responses = self._roundtrip(sock, calls)
+            except (OSError, MemoryServiceError) as e:
+                if sock is not None:
+                    self._release(sock, broken=True)
+                if attempt == attempts - 1:
+                    raise MemoryServiceError(f"memory service unreachable: {e}") from e
+                continue
+            self._release(sock)
+            break
+
+        results = []
+        for ok, value in responses:
+            if not ok:
+                raise MemoryServiceError(value)
+            results.append(value)
+        return results
+
+    def call(self, method, *args, **kwargs):
+        return self.pipeline([(method, args, kwargs)])[0]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def retrieve_all(self, user_id, query_text, n_results=5, group_id=None):
+        """活跃记录 + profile 摘要、insights、近期对话（及群组上下文）一次往返取回"""
+        calls = [
+            ("touch", (user_id,), {}),
+            ("get_profile_summary", (user_id,), {}),
+            ("retrieve_insights", (user_id, query_text, n_results), {"group_id": group_id}),
+            ("get_recent_raw_entries", (user_id,), {"limit": 5}),
+        ]
+        if group_id:
+            calls.append(("get_group_context", (group_id,), {}))
+        results = self.pipeline(calls)[1:]
+        profile, insights, recent_entries = results[:3]
+        memories = {
+            "profile": profile,
+            "insights": insights,
+            "recent_raw": "\n".join([item['content'] for item in recent_entries]),
+            "recent_entries": recent_entries
+        }
+        if group_id:
+            memories["group"] = results[3]
+        return memories
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+            except Exception:
+                pass
+
+
+def main():
+    from .memory import MemoryManager
+    from .embeddings import configured_model
+
+    parser = argparse.ArgumentParser(description="Sakiko shared memory service")
+    parser.add_argument("--address", default="unix:///AstrBot/data/soulmate_data/memory.sock")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-max-size", type=int, default=16)
+    parser.add_argument("--batch-max-wait-ms", type=float, default=0.0)
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--quantization", choices=["float16", "int8"], default="float16")
+    parser.add_argument("--tiering-idle-days", type=float, default=0)
+    parser.add_argument("--tiering-interval-hours", type=float, default=6)
+    parser.add_argument("--stats-reconcile-hours", type=float, default=6)
+    parser.add_argument("--warmup-cache-users", type=int, default=256)
+    parser.add_argument("--warmup-ttl-seconds", type=float, default=300)
+    parser.add_argument("--warmup-top-users", type=int, default=50)
+    parser.add_argument("--group-recent-turns", type=int, default=8)
+    parser.add_argument("--embedding-model", default=None,
+                        help="defaults to embedding_model in the plugin config.json")
+    args = parser.parse_args()
+
+    manager = MemoryManager(None, batch_max_size=args.batch_max_size, batch_max_wait_ms=args.batch_max_wait_ms,
+                            backend=args.backend, quantization=args.quantization,
+                            tiering_idle_days=args.tiering_idle_days,
+                            warmup_cache_users=args.warmup_cache_users,
+                            warmup_ttl_seconds=args.warmup_ttl_seconds,
+                            group_recent_turns=args.group_recent_turns,
+                            embedding_model=args.embedding_model if args.embedding_model is not None
+                            else configured_model())
+    if args.warmup_top_users > 0:
+        manager.warm_start(args.warmup_top_users)
+    server = MemoryServer(manager, args.address, workers=args.workers)
+
+    async def serve():
+        tasks = [server.run_periodic("reconcile_stats", args.stats_reconcile_hours * 3600, initial_delay=60)]
+        if args.tiering_idle_days > 0:
+            tasks.append(server.run_periodic("run_tiering", args.tiering_interval_hours * 3600,
+                                             initial_delay=args.tiering_interval_hours * 3600))
+        await asyncio.gather(server.serve_forever(), *tasks)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
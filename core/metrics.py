@@ -0,0 +1,94 @@
+# plugins/astrbot_plugin_ai_personality/core/metrics.py
+# -*- coding: utf-8 -*-
+"""
+Lightweight in-process metrics registry.
+
+- counters: 单调递增计数 (shed 次数、缓存命中等)
+- gauges:   瞬时值 (队列深度、工作集大小等)
+- samples:  有界采样窗口，用于计算均值 / 分位数 (延迟、批大小等)
+"""
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+SAMPLE_WINDOW = 1024
+
+
+class Metrics:
+    def __init__(self, window=SAMPLE_WINDOW):
+        self._lock = threading.Lock()
+        self._window = window
+        self._counters = {}
+        self._gauges = {}
+        self._samples = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            buf = self._samples.get(name)
+            if buf is None:
+                buf = self._samples[name] = deque(maxlen=self._window)
+            buf.append(float(value))
+
+    @contextmanager
+    def timer(self, name):
+        """记录代码块耗时（毫秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            summaries = {}
+            for name, buf in self._samples.items():
+                values = sorted(buf)
+                if not values:
+                    continue
+                summaries[name] = {
+                    "count": len(values),
+                    "avg": sum(values) / len(values),
+                    "p50": _percentile(values, 50),
+                    "p95": _percentile(values, 95),
+                    "max": values[-1],
+                }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "samples": summaries,
+            }
+
+    def format_report(self):
+        snap = self.snapshot()
+        lines = ["📈 [Sakiko Perf]"]
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f"{name}: {value}")
+        for name, value in sorted(snap["gauges"].items()):
+            lines.append(f"{name}: {value:g}" if isinstance(value, (int, float)) else f"{name}: {value}")
+        for name, s in sorted(snap["samples"].items()):
+            lines.append(
+                f"{name}: avg={s['avg']:.2f} p50={s['p50']:.2f} p95={s['p95']:.2f} max={s['max']:.2f} (n={s['count']})"
+            )
+        return "\n".join(lines) if len(lines) > 1 else "📈 [Sakiko Perf]\n（暂无数据）"
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+# 插件内共享的全局实例
+metrics = Metrics()
@@ -0,0 +1,140 @@
+# plugins/astrbot_plugin_ai_personality/core/profile.py
+# -*- coding: utf-8 -*-
+"""
+Compact user profile representation.
+
+- 列表字段使用按插入 / 最近更新排序、有容量上限的集合，超出时淘汰最久未出现的项
+- profile 摘要在变更时失效，读取时按需重算一次
+- 序列化只保存与默认值不同的字段；不认识的字段（旧版本或其他工具写入的）原样保留
+"""
+
+SUMMARY_PLACEHOLDER = "（用户资料正在学习中...）"
+DEFAULT_LIST_CAP = 20
+
+
+class CappedOrderedSet:
+    """有序去重集合：重复添加会把元素移到末尾（视为最近），超出容量时淘汰最旧的元素"""
+    __slots__ = ("_items", "cap")
+
+    def __init__(self, items=(), cap=DEFAULT_LIST_CAP):
+        self._items = {}
+        self.cap = cap
+        self.extend(items)
+
+    def add(self, item):
+        self._items.pop(item, None)
+        self._items[item] = None
+        while len(self._items) > self.cap:
+            del self._items[next(iter(self._items))]
+
+    def extend(self, items):
+        for item in items:
+            self.add(item)
+
+    def recent(self, n):
+        """最近的 n 个元素（按时间先后）"""
+        items = list(self._items)
+        return items[-n:] if n else []
+
+    def to_list(self):
+        return list(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+
+class UserProfile:
+    SCALAR_DEFAULTS = {
+        "communication_style": "balanced",
+        "humor_level": "moderate",
+        "caring_frequency": "moderate",
+        "last_context": "",
+        "relationship_summary": "",
+        "total_conversations": 0,
+        "last_interaction_time": 0,
+    }
+    LIST_FIELDS = ("sensitive_topics", "preferred_topics", "interaction_patterns", "personality_traits")
+
+    __slots__ = tuple(SCALAR_DEFAULTS) + LIST_FIELDS + ("version", "_summary", "_extra")
+
+    def __init__(self, list_cap=DEFAULT_LIST_CAP):
+        for key, value in self.SCALAR_DEFAULTS.items():
+            setattr(self, key, value)
+        for key in self.LIST_FIELDS:
+            setattr(self, key, CappedOrderedSet(cap=list_cap))
+        self.version = 0
+        self._summary = None
+        self._extra = {}
+
+    @classmethod
+    def from_stored(cls, stored, list_cap=DEFAULT_LIST_CAP):
+        """从 dynamic_profiles.json 中的记录构建（兼容旧的字符串格式）"""
+        profile = cls(list_cap)
+        if isinstance(stored, str):
+            if stored and stored != "普通用户":
+                profile.relationship_summary = stored
+        elif isinstance(stored, dict):
+            profile._apply(stored)
+        return profile
+
+    def _apply(self, updates):
+        for key, value in updates.items():
+            if key in self.LIST_FIELDS:
+                if isinstance(value, (list, tuple)):
+                    getattr(self, key).extend(value)
+                else:
+                    getattr(self, key).add(value)
+            elif key in self.SCALAR_DEFAULTS:
+                setattr(self, key, value)
+            else:
+                self._extra[key] = value
+
+    def merge(self, updates):
+        """增量更新：列表字段按最近出现排序合并，标量字段直接覆盖"""
+        self._apply(updates)
+        self.version += 1
+        self._summary = None
+
+    def touch(self, timestamp):
+        self.last_interaction_time = timestamp
+
+    def summary(self):
+        """prompt 注入用的简洁摘要，profile 未变化时直接返回缓存"""
+        if self._summary is None:
+            parts = []
+            if self.relationship_summary:
+                parts.append(f"【关系定位】{self.relationship_summary}")
+            if self.personality_traits:
+                parts.append(f"【用户性格】{', '.join(self.personality_traits.recent(5))}")  # 只取最近5个
+            if self.communication_style != "balanced":
+                parts.append(f"【沟通风格】{self.communication_style}")
+            if self.humor_level != "moderate":
+                parts.append(f"【幽默程度】{self.humor_level}")
+            if self.sensitive_topics:
+                parts.append(f"【敏感话题】{', '.join(self.sensitive_topics)}")
+            self._summary = "\n".join(parts) if parts else SUMMARY_PLACEHOLDER
+        return self._summary
+
+    def to_dict(self):
+        """完整字典（与旧版 get_user_profile 返回格式一致）"""
+        data = dict(self._extra)
+        data.update({key: getattr(self, key) for key in self.SCALAR_DEFAULTS})
+        for key in self.LIST_FIELDS:
+            data[key] = getattr(self, key).to_list()
+        return data
+
+    def to_compact(self):
+        """持久化格式：只保留非默认值"""
+        data = dict(self._extra)
+        data.update({key: getattr(self, key) for key, default in self.SCALAR_DEFAULTS.items()
+                     if getattr(self, key) != default})
+        for key in self.LIST_FIELDS:
+            if getattr(self, key):
+                data[key] = getattr(self, key).to_list()
+        return data
@@ -0,0 +1,195 @@
+# plugins/astrbot_plugin_ai_personality/core/profiler.py
+# -*- coding: utf-8 -*-
+"""
+On-demand sampling profiler for live bots.
+
+在独立线程中按固定间隔采样：
+- 线程：sys._current_frames()，只保留栈中包含插件代码的样本
+- 协程：事件循环上所有 asyncio Task 的 await 链（挂起中的协程）
+结果写成 collapsed-stack（flamegraph.pl / speedscope 均可读取）与 speedscope JSON，
+并统计插件文件中的热点帧。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from collections import Counter
+
+from .log import logger
+
+DEFAULT_INTERVAL = 0.005
+MAX_DURATION = 300
+PLUGIN_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FOCUS_FILES = ("core/memory.py", "core/agent.py", "main.py")
+
+
+class ProfileResult:
+    __slots__ = ("samples", "duration", "collapsed_path", "speedscope_path", "hot_frames")
+
+    def __init__(self, samples, duration, collapsed_path, speedscope_path, hot_frames):
+        self.samples = samples
+        self.duration = duration
+        self.collapsed_path = collapsed_path
+        self.speedscope_path = speedscope_path
+        self.hot_frames = hot_frames
+
+    def format_report(self, top=10):
+        lines = [
+            f"🔥 [Sakiko Profile] {self.samples} samples / {self.duration:.0f}s",
+            f"collapsed: {self.collapsed_path}",
+            f"speedscope: {self.speedscope_path}",
+        ]
+        total = sum(count for _, count in self.hot_frames) or 1
+        for (rel, line, func), count in self.hot_frames[:top]:
+            lines.append(f"{count / total:6.1%}  {rel}:{line} {func}")
+        if not self.hot_frames:
+            lines.append("（采样期间插件代码未在运行）")
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir, interval=DEFAULT_INTERVAL, root=PLUGIN_ROOT, focus_files=FOCUS_FILES):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.root = root
+        self.focus = {os.path.join(root, f) for f in focus_files}
+        self._running = threading.Lock()
+
+    @property
+    def busy(self):
+        return self._running.locked()
+
+    def _frame_key(self, frame):
+        code = frame.f_code
+        return (code.co_filename, frame.f_lineno, code.co_name)
+
+    def _thread_stacks(self, own_ident):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_key(frame))
+                frame = frame.f_back
+            stack.reverse()
+            yield stack
+
+    @staticmethod
+    def _task_stacks(loop):
+        try:
+            tasks = list(asyncio.all_tasks(loop))
+        except RuntimeError:
+            # 其他线程正在修改任务集合，跳过本次协程采样
+            return
+        for task in tasks:
+            coro = task.get_coro()
+            stack = []
+            while coro is not None:
+                frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+                if frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, frame.f_lineno, code.co_name))
+                coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+            if stack:
+                yield [("<task>", 0, task.get_name())] + stack
+
+    def _in_plugin(self, stack):
+        """只保留运行插件代码的栈，排除采样器自身（等待采样结果的协程）"""
+        files = {filename for filename, _, _ in stack}
+        return __file__ not in files and any(f.startswith(self.root) for f in files)
+
+    def sample(self, duration, loop=None):
+        """阻塞采样 duration 秒，返回 ProfileResult"""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("profiler already running")
+        try:
+            return self._sample(min(float(duration), MAX_DURATION), loop)
+        finally:
+            self._running.release()
+
+    def _sample(self, duration, loop):
+        own = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        start = time.perf_counter()
+        deadline = start + duration
+        while time.perf_counter() < deadline:
+            for stack in self._thread_stacks(own):
+                if self._in_plugin(stack):
+                    stacks[tuple(stack)] += 1
+            if loop is not None:
+                for stack in self._task_stacks(loop):
+                    if self._in_plugin(stack):
+                        stacks[tuple(stack)] += 1
+            samples += 1
+            time.sleep(self.interval)
+        elapsed = time.perf_counter() - start
+        return self._write(stacks, samples, elapsed)
+
+    async def sample_async(self, duration):
+        """在专用线程中采样，当前事件循环的协程一并采集"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def worker():
+            try:
+                result = self.sample(duration, loop)
+                loop.call_soon_threadsafe(future.set_result, result)
+            except Exception as e:
+                loop.call_soon_threadsafe(future.set_exception, e)
+
+        threading.Thread(target=worker, name="sakiko-profiler", daemon=True).start()
+        return await future
+
+    def _label(self, key):
+        filename, line, func = key
+        if filename.startswith(self.root):
+            filename = os.path.relpath(filename, self.root)
+        return f"{func} ({filename}:{line})" if line else func
+
+    def _write(self, stacks, samples, elapsed):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        collapsed_path = os.path.join(self.output_dir, f"profile-{stamp}.collapsed")
+        speedscope_path = os.path.join(self.output_dir, f"profile-{stamp}.speedscope.json")
+
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(";".join(self._label(k).replace(";", ":") for k in stack) + f" {count}\n")
+
+        frame_index, frames, sampled, weights = {}, [], [], []
+        for stack, count in stacks.items():
+            ids = []
+            for key in stack:
+                if key not in frame_index:
+                    frame_index[key] = len(frames)
+                    filename, line, func = key
+                    frames.append({"name": func, "file": filename, "line": line})
+                ids.append(frame_index[key])
+            sampled.append(ids)
+            weights.append(count * self.interval)
+        with open(speedscope_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "$schema": "https://www.speedscope.app/file-format-schema.json",
+                "shared": {"frames": frames},
+                "profiles": [{
+                    "type": "sampled", "name": "sakiko", "unit": "seconds",
+                    "startValue": 0, "endValue": elapsed,
+                    "samples": sampled, "weights": weights,
+                }],
+                "name": f"sakiko {stamp}",
+                "exporter": "sakiko-profiler",
+            }, f)
+
+        # 热点：每个样本中最靠近栈顶的关注文件帧
+        hot = Counter()
+        for stack, count in stacks.items():
+            for filename, line, func in reversed(stack):
+                if filename in self.focus:
+                    hot[(os.path.relpath(filename, self.root), line, func)] += count
+                    break
+
+        logger.info(f"[Sakiko Profile] {samples} samples written to {collapsed_path}")
+        return ProfileResult(samples, elapsed, collapsed_path, speedscope_path, hot.most_common())
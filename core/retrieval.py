@@ -0,0 +1,158 @@
+# plugins/astrbot_plugin_ai_personality/core/retrieval.py
+# -*- coding: utf-8 -*-
+"""
+Micro-batched retrieval scheduler.
+
+活跃群聊里多个用户几乎同时 @ bot 时，每个请求都在各自的 to_thread 线程里单独调用
+coll.query(query_texts=[...])。这里把已在排队的检索请求攒成一批：
+1. 一次调用 embedding 函数得到所有查询向量
+2. 按分区 (user_id, type, n_results) 分组，每组一次 query_embeddings 批量查询
+3. 把结果分发回各个等待中的调用方
+
+默认不为凑批而等待（max_wait_ms=0）：没有其他请求排队时立即发车，上一批执行期间到达的请求
+自然合成下一批，单个请求不承担额外延迟。
+"""
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from .log import logger
+from .metrics import metrics
+
+DEFAULT_MAX_BATCH = 16
+DEFAULT_MAX_WAIT_MS = 0.0
+
+QUERY_EXPANSION_MAP = {
+    "累": ["工作", "疲劳", "忙", "困", "疲倦", "劳累"],
+    "忙": ["工作", "加班", "赶工", "紧急", "deadline"],
+    "懒": ["休息", "放松", "空闲", "摸鱼"],
+    "工作": ["上班", "任务", "项目", "demo", "急活"],
+    "疲劳": ["累", "困", "没精神", "疲惫"],
+    "抱怨": ["吐槽", "牢骚", "不满"],
+}
+
+
+def enhance_query(query_text):
+    """语义扩展查询：命中关键词时追加同义词，未命中返回空串"""
+    enhanced = []
+    for word in QUERY_EXPANSION_MAP:
+        if word in query_text:
+            enhanced.extend(QUERY_EXPANSION_MAP[word])
+
+    if not enhanced:
+        return ""
+    return " ".join([query_text] + list(dict.fromkeys(enhanced)))
+
+
+class _Request:
+    __slots__ = ("user_id", "query_text", "n_results", "doc_type", "future", "enqueued_at")
+
+    def __init__(self, user_id, query_text, n_results, doc_type):
+        self.user_id = str(user_id)
+        self.query_text = query_text
+        self.n_results = n_results
+        self.doc_type = doc_type
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class RetrievalBatcher:
+    """
+    Args:
+        embed_fn: callable(list[str]) -> list[vector]
+        query_fn: callable(query_embeddings, n_results, where) -> chroma 风格的 query 结果
+        max_batch: 单批最多请求数
+        max_wait_ms: 收到第一个请求后最多额外等待多久再发车（0 表示只合并已在排队的请求）
+    """
+
+    def __init__(self, embed_fn, query_fn, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.embed_fn = embed_fn
+        self.query_fn = query_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="sakiko-retrieval-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id, query_text, n_results=5, doc_type="insight"):
+        """阻塞等待本请求所在批次完成，返回 [(文档, 距离)]（按距离升序）"""
+        req = _Request(user_id, query_text, n_results, doc_type)
+        self._queue.put(req)
+        return req.future.result()
+
+    def submit_many(self, requests):
+        """同时提交多个 (user_id, query_text, n_results, doc_type) 请求，保证进入同一批次的机会"""
+        reqs = [_Request(*args) for args in requests]
+        for req in reqs:
+            self._queue.put(req)
+        return [req.future.result() for req in reqs]
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # 已在排队的请求直接并入；超过 max_wait 后不再等待新请求
+                req = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if req is None:
+                self._queue.put(None)
+                break
+            batch.append(req)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                self._execute(batch)
+            except Exception as e:
+                logger.error(f"[Sakiko Retrieval] Batch failed: {e}")
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+
+    def _execute(self, batch):
+        started = time.perf_counter()
+        for req in batch:
+            metrics.observe("retrieval.batch_wait_ms", (started - req.enqueued_at) * 1000)
+        metrics.observe("retrieval.batch_size", len(batch))
+
+        # 相同查询文本只嵌入一次
+        texts = list(dict.fromkeys(req.query_text for req in batch))
+        vectors = dict(zip(texts, self.embed_fn(texts)))
+
+        partitions = {}
+        for req in batch:
+            partitions.setdefault((req.user_id, req.doc_type, req.n_results), []).append(req)
+        metrics.observe("retrieval.partitions_per_batch", len(partitions))
+
+        for (user_id, doc_type, n_results), reqs in partitions.items():
+            try:
+                results = self.query_fn(
+                    query_embeddings=[vectors[req.query_text] for req in reqs],
+                    n_results=n_results,
+                    where={"$and": [{"user_id": user_id}, {"type": doc_type}]}
+                )
+                documents = results.get("documents") or []
+                distances = results.get("distances") or []
+                for i, req in enumerate(reqs):
+                    docs = documents[i] if i < len(documents) else []
+                    dists = distances[i] if i < len(distances) else [0.0] * len(docs)
+                    req.future.set_result(list(zip(docs, dists)))
+            except Exception as e:
+                for req in reqs:
+                    req.future.set_exception(e)
+
+        metrics.observe("retrieval.batch_exec_ms", (time.perf_counter() - started) * 1000)
+
+    def close(self):
+        self._queue.put(None)
@@ -0,0 +1,128 @@
+# plugins/astrbot_plugin_ai_personality/core/session.py
+# -*- coding: utf-8 -*-
+"""
+Session-aware delta injection.
+
+原生 agent 会保留自己的对话历史，同一会话内重复注入相同的 profile / insights /
+近期对话只会在上下文窗口里堆积。这里按 (user_id, session_id) 记录已经注入过的内容：
+- insight 指纹集合
+- profile 版本
+- 最后一条已注入的对话时间戳 (turn id)
+- 群摘要版本与最后一条已注入的群聊时间戳（群聊中）
+首轮或需要刷新时全量注入，其余轮次只注入新增 / 变化的部分。
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .metrics import metrics
+
+DEFAULT_REFRESH_TURNS = 20
+DEFAULT_IDLE_SECONDS = 30 * 60
+MAX_TRACKED_SESSIONS = 4096
+
+
+def fingerprint(text: str) -> str:
+    """短指纹，用于判断内容是否已注入"""
+    return hashlib.blake2b((text or "").encode("utf-8"), digest_size=8).hexdigest()
+
+
+class _SessionState:
+    __slots__ = ("insight_fps", "profile_version", "last_turn_ts", "group_version", "last_group_ts",
+                 "turns", "last_seen")
+
+    def __init__(self):
+        self.insight_fps = set()
+        self.profile_version = None
+        self.last_turn_ts = 0.0
+        self.group_version = None
+        self.last_group_ts = 0.0
+        self.turns = 0
+        self.last_seen = 0.0
+
+
+class InjectionTracker:
+    def __init__(self, refresh_turns=DEFAULT_REFRESH_TURNS, idle_seconds=DEFAULT_IDLE_SECONDS,
+                 max_sessions=MAX_TRACKED_SESSIONS):
+        self.refresh_turns = max(1, int(refresh_turns))
+        self.idle_seconds = float(idle_seconds)
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def select(self, user_id, session_id, profile_summary, profile_version, insights, recent_entries,
+               group_summary="", group_version=None, group_recent=()):
+        """
+        决定本轮需要注入的内容，并更新会话记录。
+
+        Args:
+            profile_summary: profile 摘要文本
+            profile_version: profile 版本（变化时重新注入 profile）
+            insights: 本轮检索到的 insight 文本列表
+            recent_entries: [{"ts": float, "content": str}, ...]，按时间倒序
+            group_summary / group_version / group_recent: 群组上下文（私聊时为空）
+
+        Returns:
+            {"full": bool, "profile": str | None, "insights": [...], "recent": [...],
+             "group": str | None, "group_recent": [...]}
+            full=True 时调用方应按完整模板渲染
+        """
+        key = (str(user_id), str(session_id))
+        now = time.time()
+        with self._lock:
+            state = self._sessions.pop(key, None)
+            full = (
+                state is None
+                or state.turns >= self.refresh_turns
+                or now - state.last_seen > self.idle_seconds
+            )
+            if full:
+                state = _SessionState()
+            self._sessions[key] = state
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+            insight_fps = {fingerprint(i): i for i in insights}
+            new_insights = [text for fp, text in insight_fps.items() if fp not in state.insight_fps]
+            profile_changed = profile_version != state.profile_version
+            new_recent = [e for e in recent_entries if e.get("ts", 0) > state.last_turn_ts]
+            group_changed = group_version != state.group_version
+            new_group_recent = [e for e in group_recent if e.get("ts", 0) > state.last_group_ts]
+
+            state.insight_fps.update(insight_fps)
+            state.profile_version = profile_version
+            if recent_entries:
+                state.last_turn_ts = max(state.last_turn_ts, max(e.get("ts", 0) for e in recent_entries))
+            state.group_version = group_version
+            if group_recent:
+                state.last_group_ts = max(state.last_group_ts, max(e.get("ts", 0) for e in group_recent))
+            state.turns = 1 if full else state.turns + 1
+            state.last_seen = now
+
+        metrics.incr("injection.full" if full else "injection.delta")
+        return {
+            "full": full,
+            "profile": profile_summary if (full or profile_changed) else None,
+            "insights": insights if full else new_insights,
+            "recent": recent_entries if full else new_recent,
+            "group": group_summary if (full or group_changed) else None,
+            "group_recent": list(group_recent) if full else new_group_recent,
+        }
+
+    def reset(self, user_id=None, session_id=None):
+        """清除记录，下一轮强制全量注入"""
+        with self._lock:
+            if user_id is None:
+                self._sessions.clear()
+                return
+            for key in [k for k in self._sessions if k[0] == str(user_id)
+                        and (session_id is None or k[1] == str(session_id))]:
+                del self._sessions[key]
+
+    def reset_prefix(self, session_prefix):
+        """清除以 session_prefix 开头的所有会话（会话 id 形如 "<origin>#<conversation>"）"""
+        prefix = str(session_prefix)
+        with self._lock:
+            for key in [k for k in self._sessions if k[1] == prefix or k[1].startswith(prefix + "#")]:
+                del self._sessions[key]
@@ -0,0 +1,223 @@
+# plugins/astrbot_plugin_ai_personality/core/stats.py
+# -*- coding: utf-8 -*-
+"""
+Materialized per-user memory statistics.
+
+每次写入 / 删除时增量维护：
+- counts: 按类型 (raw / insight / ...) 的条数
+- bytes:  文档总字节数
+- oldest / newest: 最早 / 最新记录的时间戳
+- recent: 最近几条记录，供 /status 直接展示
+
+删除最早的记录后 oldest 只能保持为下界，由后台对账任务按实际存储纠正，
+对账同时修复进程崩溃等原因造成的计数漂移。
+落盘按 FLUSH_INTERVAL 合并，崩溃时丢失的增量同样由启动后的对账补齐。
+"""
+import os
+import json
+import time
+import threading
+
+from .log import logger
+from .metrics import metrics
+
+STATS_FILE = "memory_stats.json"
+RECENT_LIMIT = 5
+PAGE_SIZE = 256
+FLUSH_INTERVAL = 30
+RESCAN_ATTEMPTS = 3
+
+
+def _empty():
+    return {"counts": {}, "bytes": 0, "oldest": 0.0, "newest": 0.0, "recent": []}
+
+
+def _size(content):
+    return len((content or "").encode("utf-8"))
+
+
+def _apply_add(entry, doc_type, content, ts, recent_limit=RECENT_LIMIT):
+    entry["counts"][doc_type] = entry["counts"].get(doc_type, 0) + 1
+    entry["bytes"] += _size(content)
+    entry["oldest"] = ts if not entry["oldest"] else min(entry["oldest"], ts)
+    entry["newest"] = max(entry["newest"], ts)
+    if len(entry["recent"]) < recent_limit or ts > entry["recent"][-1][0]:
+        entry["recent"].append([ts, doc_type, content])
+        entry["recent"].sort(key=lambda item: item[0], reverse=True)
+        del entry["recent"][recent_limit:]
+
+
+class MemoryStats:
+    def __init__(self, data_dir, recent_limit=RECENT_LIMIT):
+        self.path = os.path.join(data_dir, STATS_FILE)
+        self.recent_limit = recent_limit
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_flush = time.time()
+        # 对账扫描期间被增删的用户及其变更次数，扫描结果对这些用户不可信
+        self._scanning = False
+        self._touched = {}
+        self.users = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.users = json.load(f)
+            except Exception as e:
+                logger.warning(f"[Sakiko Stats] Failed to load stats, will reconcile: {e}")
+
+    @property
+    def empty(self):
+        return not self.users
+
+    def get(self, user_id):
+        """O(1) 读取（返回副本）"""
+        with self._lock:
+            entry = self.users.get(str(user_id)) or _empty()
+            return {**entry, "counts": dict(entry["counts"]), "recent": [list(r) for r in entry["recent"]]}
+
+    def count(self, user_id, doc_type):
+        with self._lock:
+            entry = self.users.get(str(user_id))
+            return entry["counts"].get(doc_type, 0) if entry else 0
+
+    def _mark(self, user_id):
+        """调用方持有锁"""
+        self._dirty = True
+        if self._scanning:
+            self._touched[user_id] = self._touched.get(user_id, 0) + 1
+
+    def on_add(self, user_id, doc_type, content, ts):
+        user_id = str(user_id)
+        with self._lock:
+            entry = self.users.setdefault(user_id, _empty())
+            _apply_add(entry, doc_type, content, ts, self.recent_limit)
+            self._mark(user_id)
+        self._maybe_flush()
+
+    def on_delete(self, user_id, doc_type, content, ts):
+        user_id = str(user_id)
+        with self._lock:
+            self._mark(user_id)
+            entry = self.users.get(user_id)
+            if entry is None:
+                return
+            entry["counts"][doc_type] = max(0, entry["counts"].get(doc_type, 0) - 1)
+            entry["bytes"] = max(0, entry["bytes"] - _size(content))
+            entry["recent"] = [r for r in entry["recent"] if not (r[0] == ts and r[2] == content)]
+            if not any(entry["counts"].values()):
+                del self.users[user_id]
+        self._maybe_flush()
+
+    def drop(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            self._mark(user_id)
+            self.users.pop(user_id, None)
+
+    def rebuild(self, user_id, records):
+        """按给定记录重建单个用户，records: [{"document", "metadata"}]"""
+        entry = _empty()
+        for rec in records:
+            meta = rec["metadata"]
+            _apply_add(entry, meta.get("type", "unknown"), rec["document"],
+                       float(meta.get("timestamp", 0)), self.recent_limit)
+        with self._lock:
+            self.users[str(user_id)] = entry
+            self._mark(str(user_id))
+
+    def _scan(self, store, where=None):
+        """逐页扫描存储（可限定单个用户），返回 {user_id: entry}"""
+        fresh = {}
+        offset = 0
+        while True:
+            page = store.get(where=where, limit=PAGE_SIZE, offset=offset, include=("documents", "metadatas"))
+            if not page["ids"]:
+                return fresh
+            for doc, meta in zip(page["documents"], page["metadatas"]):
+                entry = fresh.setdefault(str(meta.get("user_id", "")), _empty())
+                _apply_add(entry, meta.get("type", "unknown"), doc,
+                           float(meta.get("timestamp", 0)), self.recent_limit)
+            offset += len(page["ids"])
+
+    def _replace(self, user_id, fresh_entry):
+        """调用方持有锁；返回是否发生漂移"""
+        drifted = _summary(fresh_entry) != _summary(self.users.get(user_id))
+        if fresh_entry is None:
+            self.users.pop(user_id, None)
+        else:
+            self.users[user_id] = fresh_entry
+        return drifted
+
+    def reconcile(self, store):
+        """
+        全量扫描存储重建统计，返回发生漂移的用户数。
+        扫描不持锁：期间有增删的用户（分页也可能因此错位）不采用全量结果，
+        改为逐个重扫，直到重扫期间该用户没有新的变更。
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self._scanning = True
+            self._touched = {}
+        try:
+            fresh = self._scan(store)
+            with self._lock:
+                touched = dict(self._touched)
+                drifted = sum(
+                    self._replace(uid, fresh.get(uid))
+                    for uid in (set(fresh) | set(self.users)) - set(touched)
+                )
+                self._dirty = True
+
+            for _ in range(RESCAN_ATTEMPTS):
+                if not touched:
+                    break
+                retry = {}
+                for uid, seen in touched.items():
+                    entry = self._scan(store, where={"user_id": uid}).get(uid)
+                    with self._lock:
+                        current = self._touched.get(uid, 0)
+                        if current == seen:
+                            drifted += self._replace(uid, entry)
+                        else:
+                            retry[uid] = current
+                touched = retry
+            if touched:
+                # 仍在频繁写入的用户保留增量值，下次对账再校正
+                logger.info(f"[Sakiko Stats] {len(touched)} busy users skipped, will reconcile next time")
+        finally:
+            with self._lock:
+                self._scanning = False
+                self._touched = {}
+        self.flush()
+
+        metrics.incr("stats.drift_corrected", drifted)
+        metrics.observe("stats.reconcile_ms", (time.perf_counter() - start) * 1000)
+        if drifted:
+            logger.info(f"[Sakiko Stats] Reconciled {drifted} users with drifted statistics")
+        return drifted
+
+    def _maybe_flush(self):
+        if time.time() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self.users, ensure_ascii=False, separators=(",", ":"))
+            self._dirty = False
+            self._last_flush = time.time()
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            logger.error(f"[Sakiko Stats] Save failed: {e}")
+
+
+def _summary(entry):
+    if entry is None:
+        return None
+    counts = {k: v for k, v in entry["counts"].items() if v}
+    return counts, entry["bytes"], entry["oldest"], entry["newest"]
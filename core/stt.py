@@ -0,0 +1,141 @@
+# plugins/astrbot_plugin_ai_personality/core/stt.py
+# -*- coding: utf-8 -*-
+"""
+Speech-to-text "ear" for voice messages (Record components).
+
+- 音频边下载边转发给 OpenAI 兼容的 /audio/transcriptions 接口（SiliconFlow SenseVoice 等），
+  不在内存里缓冲整个文件
+- 转发过程中同步计算内容哈希，转写结果按音频哈希缓存
+- base_url 可替换为任意兼容服务（例如测试用的本地假服务）
+"""
+import os
+import time
+import hashlib
+import aiohttp
+from collections import OrderedDict
+from aiohttp.payload import AsyncIterablePayload
+
+from .log import logger
+from .metrics import metrics
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_CACHE_SIZE = 512
+
+
+class _LRU:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = OrderedDict()
+
+    def get(self, key):
+        if key not in self._data:
+            return None
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+
+
+class SpeechTranscriber:
+    def __init__(self, base_url, api_key="", model="", cache_size=DEFAULT_CACHE_SIZE, timeout=60):
+        self.base_url = (base_url or "").rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # 音频哈希 -> 转写文本；来源 (URL / 路径) -> 音频哈希
+        self._transcripts = _LRU(cache_size)
+        self._aliases = _LRU(cache_size)
+
+    @property
+    def enabled(self):
+        return bool(self.base_url and self.model)
+
+    async def transcribe(self, source: str) -> str:
+        """转写一段语音，source 为 http(s) URL 或本地文件路径；失败时返回空串"""
+        if not self.enabled or not source:
+            return ""
+
+        digest = self._aliases.get(source)
+        if digest and self._transcripts.get(digest) is not None:
+            metrics.incr("stt.cache_hit")
+            return self._transcripts.get(digest)
+
+        start = time.perf_counter()
+        try:
+            if source.startswith("http"):
+                digest, text = await self._transcribe_url(source)
+            else:
+                digest, text = await self._transcribe_file(source)
+        except Exception as e:
+            logger.warning(f"[Sakiko STT] Transcription failed: {e}")
+            metrics.incr("stt.error")
+            return ""
+
+        metrics.observe("stt.latency_ms", (time.perf_counter() - start) * 1000)
+        if digest:
+            self._aliases.put(source, digest)
+            self._transcripts.put(digest, text)
+        logger.info(f"[Sakiko STT] Transcribed {len(text)} chars")
+        return text
+
+    async def _transcribe_url(self, url):
+        hasher = hashlib.sha256()
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                chunks = self._tee(resp.content.iter_chunked(CHUNK_SIZE), hasher)
+                text = await self._post_audio(session, chunks, _filename_from(url))
+        return hasher.hexdigest(), text
+
+    async def _transcribe_file(self, path):
+        # 本地文件先算哈希，命中缓存就不必上传
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        cached = self._transcripts.get(digest)
+        if cached is not None:
+            metrics.incr("stt.cache_hit")
+            return digest, cached
+
+        async def read_file():
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    yield chunk
+
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            text = await self._post_audio(session, read_file(), os.path.basename(path))
+        return digest, text
+
+    @staticmethod
+    async def _tee(chunks, hasher):
+        size = 0
+        async for chunk in chunks:
+            hasher.update(chunk)
+            size += len(chunk)
+            yield chunk
+        metrics.observe("stt.audio_kb", size / 1024)
+
+    async def _post_audio(self, session, chunks, filename):
+        """以 chunked multipart 方式把音频流转发给转写接口"""
+        with aiohttp.MultipartWriter("form-data") as form:
+            model_part = form.append(self.model)
+            model_part.set_content_disposition("form-data", name="model")
+            file_part = form.append_payload(AsyncIterablePayload(chunks, content_type="application/octet-stream"))
+            file_part.set_content_disposition("form-data", name="file", filename=filename)
+
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        async with session.post(f"{self.base_url}/audio/transcriptions", data=form, headers=headers) as resp:
+            resp.raise_for_status()
+            payload = await resp.json(content_type=None)
+        return (payload.get("text") or "").strip()
+
+
+def _filename_from(url):
+    name = os.path.basename(url.split("?", 1)[0])
+    return name if "." in name else "voice.amr"
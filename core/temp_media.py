@@ -0,0 +1,122 @@
+# plugins/astrbot_plugin_ai_personality/core/temp_media.py
+# -*- coding: utf-8 -*-
+"""
+Temp media lifecycle for /AstrBot/data/mcp_temp.
+
+- 下载先进入 SpooledTemporaryFile，小图始终留在内存里
+- 只有真正需要交给 MCP 的图片才落盘，并在调用结束后立即删除
+- 超过 TTL 的文件被清理；登记中的文件都可能正被 MCP 调用读取，因此超过配额时不淘汰，
+  而是拒绝新的写入（TempMediaQuotaExceeded）
+- 启动时清扫上次运行遗留的孤儿文件
+"""
+import os
+import time
+import uuid
+import tempfile
+import threading
+
+from .log import logger
+from .metrics import metrics
+
+DEFAULT_DIR = "/AstrBot/data/mcp_temp"
+DEFAULT_QUOTA_BYTES = 256 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MEMORY_BYTES = 512 * 1024
+FILE_PREFIX = "mcp_img_"
+
+
+class TempMediaQuotaExceeded(RuntimeError):
+    pass
+
+
+class TempMediaManager:
+    def __init__(self, directory=DEFAULT_DIR, quota_bytes=DEFAULT_QUOTA_BYTES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, memory_bytes=DEFAULT_MEMORY_BYTES):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory_bytes = memory_bytes
+        # path -> (created_at, size)
+        self._files = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.sweep_orphans()
+
+    def spool(self):
+        """下载缓冲：不超过 memory_bytes 时只在内存中"""
+        return tempfile.SpooledTemporaryFile(max_size=self.memory_bytes)
+
+    def write(self, data: bytes, ext=".jpg") -> str:
+        """落盘并登记，返回文件路径；调用方用完后应调用 release。超过配额时抛出 TempMediaQuotaExceeded"""
+        self.sweep()
+        path = os.path.join(self.directory, f"{FILE_PREFIX}{uuid.uuid4().hex}{ext}")
+        with self._lock:
+            # 目录为空时总允许写入一个文件，避免单张大图永远无法处理
+            if self._files and self._total + len(data) > self.quota_bytes:
+                metrics.incr("temp_media.rejected")
+                raise TempMediaQuotaExceeded(
+                    f"temp media quota exceeded ({self._total} + {len(data)} > {self.quota_bytes} bytes)")
+            # 先占用配额再写文件，并发写入不会一起越过配额
+            self._files[path] = (time.time(), len(data))
+            self._total += len(data)
+            self._publish()
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+        except Exception:
+            self.release(path)
+            raise
+        return path
+
+    def release(self, path):
+        """删除登记过的文件"""
+        with self._lock:
+            entry = self._files.pop(path, None)
+            if entry is None:
+                return
+            self._total -= entry[1]
+            self._publish()
+        self._unlink(path)
+
+    def sweep(self):
+        """清理超过 TTL 的登记文件（例如 MCP 调用异常时未被释放的）"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [p for p, (created, _) in self._files.items() if created < cutoff]
+        for path in expired:
+            self.release(path)
+            metrics.incr("temp_media.expired")
+
+    def sweep_orphans(self):
+        """启动时清理本插件遗留的旧文件；较新的文件可能属于共享目录的其他实例，保留"""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.startswith(FILE_PREFIX) or not entry.is_file():
+                        continue
+                    if entry.stat().st_mtime < cutoff and self._unlink(entry.path):
+                        removed += 1
+        except Exception as e:
+            logger.warning(f"[Sakiko TempMedia] Orphan sweep failed: {e}")
+        if removed:
+            logger.info(f"[Sakiko TempMedia] Removed {removed} orphan files from {self.directory}")
+        metrics.incr("temp_media.orphans_removed", removed)
+
+    def _publish(self):
+        metrics.set_gauge("temp_media.files", len(self._files))
+        metrics.set_gauge("temp_media.bytes", self._total)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"[Sakiko TempMedia] Failed to remove {path}: {e}")
+            return False
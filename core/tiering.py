@@ -0,0 +1,219 @@
+# plugins/astrbot_plugin_ai_personality/core/tiering.py
+# -*- coding: utf-8 -*-
+"""
+Hot / cold tiering of user memory.
+
+长期不活跃的用户（最后互动超过 N 天）会被整体移出热数据：
+向量库中的记忆、dynamic profile 与 state 一起写入压缩归档 archive/<user>.jsonl.gz，
+并从在线存储和内存字典中删除。用户再次发消息时透明地回迁到热层。
+
+默认关闭（idle_days=0）：开启后，升级前就存在的用户按 profile 中的 last_interaction_time
+计算闲置时间，长期未互动的老用户会在第一次整理时被归档。群组（group:<id>）的事实与
+GroupMemory 共用，不参与归档。
+"""
+import os
+import gzip
+import json
+import time
+
+from .log import logger
+from .metrics import metrics
+from .profile import UserProfile
+from .group_memory import GROUP_KEY_PREFIX
+
+ACTIVITY_FILE = "user_activity.json"
+PAGE_SIZE = 256
+
+
+class ArchiveStore:
+    def __init__(self, data_dir):
+        self.root = os.path.join(data_dir, "archive")
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def _key(user_id):
+        return str(user_id).encode("utf-8").hex()
+
+    def path(self, user_id):
+        return os.path.join(self.root, f"{self._key(user_id)}.jsonl.gz")
+
+    def list_users(self):
+        users = set()
+        for name in os.listdir(self.root):
+            if name.endswith(".jsonl.gz"):
+                try:
+                    users.add(bytes.fromhex(name[:-len(".jsonl.gz")]).decode("utf-8"))
+                except ValueError:
+                    continue
+        return users
+
+    def write(self, user_id, header, records):
+        """首行为 header（profile / state），其后每行一条记忆"""
+        final = self.path(user_id)
+        tmp = final + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        os.replace(tmp, final)
+
+    def read(self, user_id):
+        with gzip.open(self.path(user_id), "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            records = [json.loads(line) for line in f if line.strip()]
+        return header, records
+
+    def remove(self, user_id):
+        try: os.remove(self.path(user_id))
+        except FileNotFoundError: pass
+
+
+class TieringManager:
+    def __init__(self, memory, idle_days=0):
+        self.memory = memory
+        self.idle_seconds = idle_days * 86400
+        self.archive = ArchiveStore(memory.data_dir)
+        self.activity_path = os.path.join(memory.data_dir, ACTIVITY_FILE)
+        self.activity = memory._load_json(self.activity_path)
+        self.archived = self.archive.list_users()
+        # 与 MemoryManager 的 state / profile 写入共用一把锁，回迁不会与 update_state 交错
+        self._lock = memory._state_lock
+        self._publish()
+
+    @property
+    def enabled(self):
+        return self.idle_seconds > 0
+
+    def touch(self, user_id):
+        """记录活跃并确保用户数据在热层（每条消息调用，未归档时为 O(1)）"""
+        user_id = str(user_id)
+        self.activity[user_id] = time.time()
+        if user_id in self.archived:
+            self.rehydrate(user_id)
+
+    def _last_active(self, user_id):
+        profile = self.memory.profiles.get(user_id)
+        profile_ts = profile.last_interaction_time if profile is not None else 0
+        return max(float(self.activity.get(user_id, 0)), float(profile_ts or 0))
+
+    def run(self):
+        """归档所有闲置用户，返回归档人数"""
+        if not self.enabled:
+            return 0
+        now = time.time()
+        archived = 0
+        with self._lock:
+            users = set(self.memory.profiles) | set(self.memory.states) | set(self.activity)
+            users -= self.archived
+        # 只在单个用户的判断与归档期间持锁，整轮扫描不阻塞其他用户的读写
+        for user_id in users:
+            if user_id.startswith(GROUP_KEY_PREFIX):
+                continue
+            with self._lock:
+                if user_id in self.archived:
+                    continue
+                last = self._last_active(user_id)
+                if not last:
+                    # 开始追踪之前就存在的用户，从现在起计算闲置时间
+                    self.activity[user_id] = now
+                    continue
+                if now - last <= self.idle_seconds:
+                    continue
+                try:
+                    self.archive_user(user_id)
+                    archived += 1
+                except Exception as e:
+                    logger.error(f"[Sakiko Tiering] Archive failed for {user_id}: {e}")
+        with self._lock:
+            self.memory._save_json(self.activity_path, self.activity)
+        if archived:
+            logger.info(f"[Sakiko Tiering] Archived {archived} idle users")
+        self._publish()
+        return archived
+
+    def archive_user(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            store = self.memory.store
+            records, offset = [], 0
+            while True:
+                page = store.get(where={"user_id": user_id}, limit=PAGE_SIZE, offset=offset,
+                                 include=("documents", "metadatas", "embeddings"))
+                if not page["ids"]:
+                    break
+                for i, mem_id in enumerate(page["ids"]):
+                    vec = page["embeddings"][i]
+                    records.append({
+                        "id": mem_id,
+                        "document": page["documents"][i],
+                        "metadata": page["metadatas"][i],
+                        "embedding": vec.tolist() if hasattr(vec, "tolist") else list(vec),
+                    })
+                offset += len(page["ids"])
+
+            profile = self.memory.profiles.get(user_id)
+            header = {
+                "user_id": user_id,
+                "archived_at": time.time(),
+                "last_active": self._last_active(user_id),
+                "profile": profile.to_compact() if profile is not None else None,
+                "state": self.memory.states.get(user_id),
+            }
+            self.archive.write(user_id, header, records)
+
+            store.delete([r["id"] for r in records])
+            self.memory.stats.drop(user_id)
+            self.memory.stats.flush()
+            self.memory.profiles.pop(user_id, None)
+            self.memory.warmup.invalidate(user_id)
+            self.memory.states.pop(user_id, None)
+            self.activity.pop(user_id, None)
+            self.memory._save_profiles()
+            self.memory._save_json(self.memory.state_path, self.memory.states)
+            self.archived.add(user_id)
+        metrics.incr("tiering.archive_ops")
+
+    def rehydrate(self, user_id):
+        user_id = str(user_id)
+        start = time.perf_counter()
+        with self._lock:
+            if user_id not in self.archived:
+                return
+            header, records = self.archive.read(user_id)
+            for i in range(0, len(records), PAGE_SIZE):
+                chunk = records[i:i + PAGE_SIZE]
+                self.memory.store.add(
+                    ids=[r["id"] for r in chunk],
+                    documents=[r["document"] for r in chunk],
+                    metadatas=[r["metadata"] for r in chunk],
+                    embeddings=[r["embedding"] for r in chunk]
+                )
+            self.memory.stats.rebuild(user_id, records)
+            self.memory.stats.flush()
+            if header.get("profile") is not None:
+                self.memory.profiles[user_id] = UserProfile.from_stored(header["profile"],
+                                                                       self.memory.profile_list_cap)
+                self.memory._save_profiles()
+            if header.get("state") is not None:
+                self.memory.states[user_id] = header["state"]
+                self.memory._save_json(self.memory.state_path, self.memory.states)
+            self.archive.remove(user_id)
+            self.archived.discard(user_id)
+            self.activity[user_id] = time.time()
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        metrics.observe("tiering.rehydrate_ms", elapsed_ms)
+        metrics.incr("tiering.rehydrate_ops")
+        logger.info(f"[Sakiko Tiering] Rehydrated user {user_id} ({len(records)} memories) in {elapsed_ms:.1f}ms")
+        self._publish()
+
+    def working_set(self):
+        hot = set(self.memory.profiles) | set(self.memory.states) | set(self.activity)
+        return {"hot_users": len(hot - self.archived), "archived_users": len(self.archived)}
+
+    def _publish(self):
+        for name, value in self.working_set().items():
+            metrics.set_gauge(f"tiering.{name}", value)
+
+    def flush(self):
+        self.memory._save_json(self.activity_path, self.activity)
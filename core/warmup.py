@@ -0,0 +1,221 @@
+# plugins/astrbot_plugin_ai_personality/core/warmup.py
+# -*- coding: utf-8 -*-
+"""
+Predictive warm-up of user memory.
+
+重启后或用户回归时，第一条回复要承担冷启动开销（Chroma 页面未载入、embedding 模型未加载、
+profile 未解析）。预热子系统：
+- 记录每个用户的近期活跃度（被注入时计数，指数衰减，最多追踪 MAX_TRACKED_USERS 人，持久化到 warmup_activity.json）
+- 插件加载后在后台预取最活跃用户的最近对话、profile 摘要，并把 insight 向量页读入缓存
+- 群聊中看到用户的任意消息就开始预取，不等准入判断；只预取已有 state 且未归档的用户，
+  潜水用户的消息不会触发归档回迁
+
+预取结果只缓存最近对话（LRU + TTL，条数有上限），写入 / 删除时失效；
+待预取队列有上限，满了直接丢弃。命中率通过 warmup.hit / warmup.miss 统计。
+"""
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict
+
+from .log import logger
+from .metrics import metrics
+
+ACTIVITY_FILE = "warmup_activity.json"
+HALF_LIFE_SECONDS = 3 * 86400
+MAX_TRACKED_USERS = 10000
+RECENT_LIMIT = 5
+INSIGHT_PAGE = 64
+
+
+class _WarmEntry:
+    __slots__ = ("recent", "warmed_at")
+
+    def __init__(self, recent, warmed_at):
+        self.recent = recent
+        self.warmed_at = warmed_at
+
+
+class WarmupManager:
+    """
+    Args:
+        memory: MemoryManager
+        max_users: 预取缓存最多保留的用户数
+        ttl_seconds: 预取结果的有效期
+        queue_size: 待预取队列上限
+    """
+
+    def __init__(self, memory, max_users=256, ttl_seconds=300, queue_size=64):
+        self.memory = memory
+        self.max_users = max(1, int(max_users))
+        self.ttl = float(ttl_seconds)
+        self.activity_path = os.path.join(memory.data_dir, ACTIVITY_FILE)
+        stored = memory._load_json(self.activity_path)
+        # 按最后活跃时间排序，超出上限时淘汰最久未活跃的用户
+        self.activity = OrderedDict(sorted(stored.items(), key=lambda item: item[1][1]))
+
+        self._cache = OrderedDict()
+        self._pending = set()
+        self._stale = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._thread = threading.Thread(target=self._run, name="sakiko-warmup", daemon=True)
+        self._thread.start()
+
+    # === 活跃度 ===
+
+    def record(self, user_id, now=None):
+        """记一次活跃：score 按半衰期衰减后 +1"""
+        now = now or time.time()
+        with self._lock:
+            score, last = self.activity.pop(user_id, (0.0, now))
+            decay = 0.5 ** (max(0.0, now - last) / HALF_LIFE_SECONDS)
+            self.activity[user_id] = [score * decay + 1.0, now]
+            while len(self.activity) > MAX_TRACKED_USERS:
+                self.activity.popitem(last=False)
+
+    def top_users(self, n):
+        now = time.time()
+        with self._lock:
+            scored = [
+                (score * 0.5 ** (max(0.0, now - last) / HALF_LIFE_SECONDS), user_id)
+                for user_id, (score, last) in self.activity.items()
+            ]
+        scored.sort(reverse=True)
+        return [user_id for _, user_id in scored[:n]]
+
+    # === 预取 ===
+
+    def _eligible(self, user_id):
+        """只预取已有 state 且未归档的用户"""
+        return user_id in self.memory.states and user_id not in self.memory.tiering.archived
+
+    def prefetch(self, user_id):
+        """排队预取（不阻塞；不符合条件、已缓存或已在队列中时跳过，队列满时丢弃）"""
+        user_id = str(user_id)
+        if not self._eligible(user_id):
+            metrics.incr("warmup.skipped")
+            return False
+        with self._lock:
+            if user_id in self._pending or self._fresh(user_id) is not None:
+                return False
+            self._pending.add(user_id)
+            generation = self._generation
+        try:
+            self._queue.put_nowait((generation, user_id))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(user_id)
+            metrics.incr("warmup.shed")
+            return False
+
+    def warm_start(self, top_n):
+        """启动预热：先加载 embedding 模型，再预取最活跃的 top_n 个用户"""
+        start = time.perf_counter()
+        try:
+            self.memory.embed_fn(["warm up"])
+        except Exception as e:
+            logger.warning(f"[Sakiko Warmup] Embedding model warm-up failed: {e}")
+        metrics.observe("warmup.model_ms", (time.perf_counter() - start) * 1000)
+
+        queued = sum(1 for user_id in self.top_users(top_n) if self.prefetch(user_id))
+        logger.info(f"[Sakiko Warmup] Queued {queued} users for prefetch")
+        return queued
+
+    def cancel(self):
+        """丢弃所有尚未执行的预取（正在执行的那一个完成后结果也会被丢弃）"""
+        with self._lock:
+            self._generation += 1
+            self._pending.clear()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def close(self):
+        """停止预取线程（先 cancel 清空队列，保证哨兵能放进去）"""
+        self.cancel()
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            generation, user_id = item
+            with self._lock:
+                if generation != self._generation:
+                    continue
+                # 预取进行中若发生写入，结果作废
+                self._stale[user_id] = False
+            start = time.perf_counter()
+            try:
+                recent = self._warm(user_id)
+            except Exception as e:
+                logger.warning(f"[Sakiko Warmup] Prefetch failed for {user_id}: {e}")
+                recent = None
+            with self._lock:
+                self._pending.discard(user_id)
+                stale = self._stale.pop(user_id, True)
+                if recent is not None and not stale and generation == self._generation:
+                    self._cache[user_id] = _WarmEntry(recent, time.time())
+                    self._cache.move_to_end(user_id)
+                    while len(self._cache) > self.max_users:
+                        self._cache.popitem(last=False)
+                metrics.set_gauge("warmup.cached_users", len(self._cache))
+            metrics.observe("warmup.prefetch_ms", (time.perf_counter() - start) * 1000)
+
+    def _warm(self, user_id):
+        memory = self.memory
+        memory.get_profile_summary(user_id)
+        # 只把 insight 向量读入存储后端的页缓存，不在这里持有
+        memory.store.get(
+            where={"$and": [{"user_id": user_id}, {"type": "insight"}]},
+            include=["embeddings"],
+            limit=INSIGHT_PAGE
+        )
+        return memory._load_recent_raw_entries(user_id, RECENT_LIMIT)
+
+    # === 读取 / 失效 ===
+
+    def _fresh(self, user_id):
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+        if time.time() - entry.warmed_at > self.ttl:
+            del self._cache[user_id]
+            return None
+        return entry
+
+    def take_recent(self, user_id, limit):
+        """命中时返回预取的最近对话，否则返回 None"""
+        with self._lock:
+            entry = self._fresh(user_id) if limit <= RECENT_LIMIT else None
+            if entry is not None:
+                self._cache.move_to_end(user_id)
+                self._hits += 1
+            else:
+                self._misses += 1
+            total = self._hits + self._misses
+            hit_rate = self._hits / total
+        metrics.incr("warmup.hit" if entry is not None else "warmup.miss")
+        metrics.set_gauge("warmup.hit_rate", round(hit_rate, 3))
+        return list(entry.recent[:limit]) if entry is not None else None
+
+    def invalidate(self, user_id):
+        with self._lock:
+            user_id = str(user_id)
+            self._cache.pop(user_id, None)
+            if user_id in self._stale:
+                self._stale[user_id] = True
+
+    def flush(self):
+        with self._lock:
+            snapshot = dict(self.activity)
+        self.memory._save_json(self.activity_path, snapshot, compact=True)
@@ -10,15 +10,21 @@ This plugin acts as a context middleware:
 4. Let AstrBot's native agent generate the final response
 """
 import os
-import time
 import asyncio
 import aiohttp
 from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.api.star import Context, Star, register
 from astrbot.api import logger
-from astrbot.api.message_components import Plain, Image
+from astrbot.api.message_components import Plain, Image, Record
 from .config import PluginConfig
-from .core.agent import SakikoAgent
+from .core.agent import SakikoAgent, INJECTION_MODE_PREFIX_STABLE
+from .core.metrics import metrics
+from .core.executors import BoundedExecutor, ExecutorSaturated
+from .core.stt import SpeechTranscriber
+from .core.profiler import SamplingProfiler
+
+BACKGROUND_WORKERS = 2
+BACKGROUND_QUEUE_SIZE = 64
 
 
 @register("soulmate_agent", "YourName", "Sakiko Persona Injection", "1.5.0-native")
@@ -29,31 +35,147 @@ class SoulmatePlugin(Star):
         self.cfg = PluginConfig(self.base_dir)
         self.agent = SakikoAgent(self.cfg)
 
-    async def _download_image_to_file(self, url):
-        """下载图片到本地"""
+        # 插件专用执行器，不与其他插件共享默认线程池
+        self.io_pool = BoundedExecutor("io", self.cfg.io_workers, self.cfg.io_queue_size)
+        self.cpu_pool = BoundedExecutor("cpu", self.cfg.cpu_workers, self.cfg.cpu_queue_size)
+        # 每条消息都会触发的后台小调用（预取、记录群聊）单独使用一个小执行器，不占用 io_pool 的准入名额
+        self.background_pool = BoundedExecutor("background", BACKGROUND_WORKERS, BACKGROUND_QUEUE_SIZE)
+
+        # 语音转写（stt_base_url / stt_model 未配置时不启用）
+        self.transcriber = SpeechTranscriber(self.cfg.stt_url, self.cfg.stt_key, self.cfg.stt_model)
+
+        # 采样分析器（仅在 enable_profiler 开启时可用）
+        self.profiler = SamplingProfiler("/AstrBot/data/soulmate_data/profiles") if self.cfg.enable_profiler else None
+
+        # 后台任务：启动预热、冷热分层、统计对账（使用共享记忆服务时由服务进程负责）
+        self._pending_calls = set()
+        self._background = []
+        if not self.agent.remote_memory:
+            self._background = [
+                asyncio.create_task(self._warm_start()),
+                asyncio.create_task(self._tiering_loop()),
+                asyncio.create_task(self._reconcile_loop()),
+            ]
+
+    async def terminate(self):
+        for task in self._background + list(self._pending_calls):
+            task.cancel()
+        try:
+            # 共享服务只关闭本 bot 的连接，不影响其他 bot
+            if self.agent.remote_memory:
+                self.agent.memory.close()
+            else:
+                await self.io_pool.run(self.agent.memory.shutdown)
+        except Exception as e:
+            logger.warning(f"[Sakiko] Failed to shut down memory: {e}")
+        self.io_pool.shutdown()
+        self.cpu_pool.shutdown()
+        self.background_pool.shutdown()
+
+    async def _warm_start(self):
+        """插件加载后在后台预热 embedding 模型与最活跃用户的记忆"""
+        if self.cfg.warmup_top_users <= 0:
+            return
+        try:
+            await self.io_pool.run(self.agent.memory.warm_start, self.cfg.warmup_top_users)
+        except ExecutorSaturated:
+            pass
+        except Exception as e:
+            logger.error(f"[Sakiko] Warm-up failed: {e}")
+
+    def _fire(self, fn, *args):
+        """在后台执行器中执行，不等待、不影响本条消息的处理；过载时直接丢弃"""
+        async def run():
+            try:
+                await self.background_pool.run(fn, *args)
+            except ExecutorSaturated:
+                metrics.incr("background.shed")
+            except Exception as e:
+                logger.debug(f"[Sakiko] Background call {getattr(fn, '__name__', fn)} failed: {e}")
+
+        task = asyncio.create_task(run())
+        self._pending_calls.add(task)
+        task.add_done_callback(self._pending_calls.discard)
+
+    async def _conversation_key(self, event):
+        """增量注入按 AstrBot 当前对话区分：新建 / 切换对话后自然从全量注入开始"""
+        umo = event.unified_msg_origin
+        try:
+            cid = await self.context.conversation_manager.get_curr_conversation_id(umo)
+        except Exception:
+            cid = None
+        return f"{umo}#{cid}" if cid else umo
+
+    def _group_id(self, event):
+        """群聊返回群号，私聊或未启用群组记忆时返回 None"""
+        if not self.cfg.group_memory:
+            return None
+        try:
+            return str(getattr(event.message_obj, "group_id", "") or "") or None
+        except Exception:
+            return None
+
+    async def _tiering_loop(self):
+        """定期把闲置用户移入归档层"""
+        interval = self.cfg.tiering_interval_hours * 3600
+        if self.cfg.tiering_idle_days <= 0 or interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                working_set = await self.io_pool.run(self.agent.memory.run_tiering)
+                logger.info(f"[Sakiko] Working set after tiering: {working_set}")
+            except ExecutorSaturated:
+                continue
+            except Exception as e:
+                logger.error(f"[Sakiko] Tiering failed: {e}")
+
+    async def _reconcile_loop(self):
+        """启动后先对账一次，之后定期纠正统计漂移"""
+        interval = self.cfg.stats_reconcile_hours * 3600
+        if interval <= 0:
+            return
+        await asyncio.sleep(60)
+        while True:
+            try:
+                drifted = await self.io_pool.run(self.agent.memory.reconcile_stats)
+                logger.info(f"[Sakiko] Stats reconciled, {drifted} users corrected")
+            except ExecutorSaturated:
+                pass
+            except Exception as e:
+                logger.error(f"[Sakiko] Stats reconciliation failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def _download_image(self, url):
+        """下载图片到缓冲区（小图只在内存中，大图才溢出到临时文件）"""
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.get(url) as resp:
                     if resp.status == 200:
-                        data = await resp.read()
-                        filename = f"mcp_img_{int(time.time())}.jpg"
-                        save_dir = "/AstrBot/data/mcp_temp"
-                        if not os.path.exists(save_dir):
-                            os.makedirs(save_dir, exist_ok=True)
-                        file_path = os.path.join(save_dir, filename)
-                        with open(file_path, "wb") as f:
-                            f.write(data)
-                        return file_path
+                        buf = self.agent.temp_media.spool()
+                        async for chunk in resp.content.iter_chunked(64 * 1024):
+                            buf.write(chunk)
+                        buf.seek(0)
+                        return buf
         except Exception as e:
             logger.error(f"[Sakiko] Download Failed: {e}")
             return None
 
+    @staticmethod
+    def _close_image(image):
+        if image is not None:
+            try: image.close()
+            except: pass
+
     # === Status Command ===
     @filter.command("status")
     async def check_status(self, event: AstrMessageEvent):
         if not self.agent: return
         user_id = str(event.get_sender_id())
-        msg = await asyncio.to_thread(self.agent.get_status, user_id)
+        try:
+            msg = await self.io_pool.run(self.agent.get_status, user_id)
+        except ExecutorSaturated:
+            msg = "（祥子正忙，请稍后再查询状态）"
 
         # 1. 发送结果
         yield event.plain_result(msg)
@@ -61,20 +183,60 @@ class SoulmatePlugin(Star):
         # 2. 停止事件传播，防止 handle_msg 再次处理
         event.stop_event()
 
+    # === Perf Commands (Admin Only) ===
+    @filter.command_group("perf")
+    def perf(self):
+        pass
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @perf.command("stats")
+    async def perf_stats(self, event: AstrMessageEvent):
+        yield event.plain_result(metrics.format_report())
+        event.stop_event()
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @perf.command("profile")
+    async def perf_profile(self, event: AstrMessageEvent, seconds: int = 30):
+        if self.profiler is None:
+            yield event.plain_result("采样分析未启用（config.json: enable_profiler）")
+        elif self.profiler.busy:
+            yield event.plain_result("已有采样正在进行")
+        else:
+            yield event.plain_result(f"开始采样 {seconds}s ...")
+            try:
+                result = await self.profiler.sample_async(seconds)
+                yield event.plain_result(result.format_report())
+            except Exception as e:
+                logger.error(f"[Sakiko] Profiling failed: {e}")
+                yield event.plain_result(f"采样失败: {e}")
+        event.stop_event()
+
     @filter.event_message_type(filter.EventMessageType.ALL)
     async def handle_msg(self, event: AstrMessageEvent):
         if not self.agent: return
         text = event.message_str or ""
-        image_path = None
+        image = None
+        record_source = None
+
+        # 准入判断之前就开始预取：被 @ 时上下文大概率已在缓存中
+        self._fire(self.agent.memory.prefetch, str(event.get_sender_id()))
 
-        # === 提取图片 ===
+        # 群内每条发言都记入群组层（近期群聊、话题），不论是否 @ bot
+        group_id = self._group_id(event)
+        if group_id and text and not text.startswith("/"):
+            self._fire(self.agent.memory.record_group_turn, group_id, event.get_sender_name(), text)
+
+        # === 提取图片 / 语音 ===
         try:
             message_chain = event.get_messages()
             for component in message_chain:
                 if isinstance(component, Image):
                     url = component.url or (component.file if str(component.file).startswith("http") else None)
                     if url:
-                        image_path = await self._download_image_to_file(url)
+                        self._close_image(image)
+                        image = await self._download_image(url)
+                elif isinstance(component, Record) and self.transcriber.enabled:
+                    record_source = component.url or component.file
         except Exception as e:
             logger.warning(f"[Sakiko] Image extraction failed: {e}")
 
@@ -82,9 +244,11 @@ class SoulmatePlugin(Star):
         if text.strip() in ["status", "/status"]:
             return
 
-        if not text and not image_path:
+        if not text and image is None and not record_source:
             return
         if text.startswith("/"):
+            self._close_image(image)
+            self.agent.on_command(text, event.unified_msg_origin)
             return
 
         # === 权限检查 ===
@@ -99,34 +263,69 @@ class SoulmatePlugin(Star):
                 if raw.get("message_type") == "private":
                     is_private = True
             if not (is_private or is_at):
+                self._close_image(image)
                 return
         except:
             if not getattr(event, "is_at", False):
+                self._close_image(image)
                 return
 
         user_id = str(event.get_sender_id())
-        user_name = event.get_sender_name()
 
-        # === 生成注入上下文（包含图像说明） ===
+        # === 生成注入上下文（包含图像说明、语音转写） ===
+        transcript = ""
         try:
-            injection_text = await asyncio.to_thread(
-                self.agent.generate_context_string,
+            if record_source:
+                # 语音转写与查询无关的记忆检索并行，转写结果再作为 insight 检索的查询文本
+                transcript, memories = await asyncio.gather(
+                    self.transcriber.transcribe(record_source),
+                    self.io_pool.run(self.agent.collect_memories, user_id, text, image, False, group_id)
+                )
+                memories = await self.io_pool.run(
+                    self.agent.add_insights, user_id, memories, transcript or text, group_id
+                )
+            else:
+                memories = await self.io_pool.run(self.agent.collect_memories, user_id, text, image, True, group_id)
+            injection_text = await self.cpu_pool.run(
+                self.agent.render_context,
                 user_id,
-                user_name,
-                text,
-                image_path
+                memories,
+                await self._conversation_key(event)
             )
+        except ExecutorSaturated as e:
+            # 过载降级：不注入，原样交给原生 agent
+            logger.warning(f"[Sakiko] Load shed for user {user_id}: {e}")
+            return
         except Exception as e:
             logger.error(f"[Sakiko] Context generation failed: {e}")
             return
+        finally:
+            self._close_image(image)
+
+        # 增量模式下本轮没有新内容，原样放行（纯语音消息仍需带上转写文本，否则原生 agent 收到空消息）
+        if not injection_text:
+            if transcript and not event.message_str:
+                event.message_str = f"（语音）{transcript}"
+            return
 
         # === 注入上下文到事件 ===
         logger.info(f"[Sakiko] Context Injected for user {user_id}")
 
         # 1. 修改 event.message_str (简单文本注入)
-        original_text = event.message_str if event.message_str else "（用户发送了图片）"
+        if event.message_str:
+            original_text = event.message_str
+        elif transcript:
+            original_text = f"（语音）{transcript}"
+        else:
+            # 语音转写失败时按实际发送的内容标注
+            media = [label for label, present in (("图片", image is not None), ("语音", record_source)) if present]
+            original_text = f"（用户发送了{'和'.join(media)}）"
         event.message_str = f"{injection_text}\n\n--- 用户消息 ---\n{original_text}"
 
+        # prefix_stable 模式只注入一次，避免与消息链重复占用上下文
+        if self.agent.injection_mode == INJECTION_MODE_PREFIX_STABLE:
+            return
+
         # 2. 修改消息链：在开头插入 Plain 组件
         try:
             message_chain = event.get_messages()